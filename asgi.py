@@ -0,0 +1,397 @@
+import argparse
+import asyncio
+import io
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import parse_qs
+
+import imagerec
+from camera import get_broker
+from eventstream import KEEPALIVE
+from metrics import REQUEST_SECONDS
+from streaming import stream_variant
+
+MULTIPART_MIMETYPE = 'multipart/x-mixed-replace; boundary=frame'
+SSE_HEADERS = [(b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no')]
+
+
+class LoopSignal:
+    """Wakes coroutines on the event loop when a worker thread publishes something.
+
+    ``notify`` may be called from any thread. It is appended to the
+    ``listeners`` list of a capture broker, frame broadcaster or event hub,
+    each of which calls its listeners after every new frame or event.
+    Waiters grab ``event`` before looking for new data and then wait on it,
+    so a publish in between is never missed.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.event = asyncio.Event()
+
+    def notify(self):
+        try:
+            self.loop.call_soon_threadsafe(self._fire)
+        except RuntimeError:
+            pass  # the loop has been closed
+
+    def _fire(self):
+        event, self.event = self.event, asyncio.Event()
+        event.set()
+
+
+class AsyncServer:
+    """ASGI front end for the attendance app.
+
+    The live feeds, the event stream and the JSON APIs run as coroutines on
+    one event loop. A viewer costs a suspended coroutine instead of a
+    sleeping OS thread, and it holds at most the one frame it is sending,
+    so memory stays bounded no matter how far behind a client falls. Frames
+    come from the same broadcasters the Flask routes use: each frame variant
+    is still encoded once, on a small thread pool, and shared by every
+    viewer. File reads behind the JSON APIs run on a thread pool too.
+
+    The registration preview is a coroutine too: it idles on the loop while
+    the registration camera is off and takes frames straight from the
+    capture broker while it is on.
+
+    Every other route (the dashboard page, registration, camera toggles and
+    so on) is handed to the Flask app unchanged, so URLs and response
+    formats are the same under both servers. Those requests run on their
+    own ``bridge`` pool, so a slow or long-lived bridged response can never
+    take the threads the JSON APIs need.
+    """
+
+    def __init__(self, flask_app, blocking_workers=16, bridge_workers=16, encode_workers=4, max_streams=1000):
+        self.flask_app = flask_app
+        self.max_streams = max_streams
+        self.streams = 0
+        self.blocking = ThreadPoolExecutor(blocking_workers, thread_name_prefix='asgi-blocking')
+        self.bridge = ThreadPoolExecutor(bridge_workers, thread_name_prefix='asgi-wsgi')
+        self.encoders = ThreadPoolExecutor(encode_workers, thread_name_prefix='asgi-encode')
+        self.loop = None
+        self._signals = {}
+        self._encoding = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        self.loop = asyncio.get_running_loop()
+
+        path = scope['path']
+        query = parse_qs(scope['query_string'].decode('latin-1'))
+        if scope['method'] == 'GET':
+            if path == '/video_feed':
+                return await self.video_feed(receive, send, query)
+            if path.startswith('/video_feed/') and '/' not in path[len('/video_feed/'):]:
+                return await self.video_feed(receive, send, query, path[len('/video_feed/'):])
+            if path == '/api/stream':
+                return await self.event_stream(scope, receive, send)
+            if path == '/registration_feed':
+                return await self.stream(receive, send, MULTIPART_MIMETYPE, self.registration_frames())
+            if path in ('/api/events', '/api/stats', '/api/attendance', '/api/report'):
+                start = time.perf_counter()
+                await self.send_json(send, await self.api(path, query))
+                REQUEST_SECONDS.labels(path, 'GET', 200).observe(time.perf_counter() - start)
+                return
+        await self.wsgi(scope, receive, send)
+
+    async def api(self, path, query):
+        if path == '/api/events':
+            return imagerec.recent_events(arg(query, 'camera'))
+        if path == '/api/stats':
+            return await self.blocking_call(imagerec.current_stats)
+        if path == '/api/attendance':
+            date = arg(query, 'date', datetime.now().strftime('%Y-%m-%d'))
+            return await self.blocking_call(imagerec.get_attendance_for_date, date)
+        start_date, end_date = imagerec.report_dates(arg(query, 'start_date'), arg(query, 'end_date'))
+        return await self.blocking_call(imagerec.get_attendance_report, start_date, end_date)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.loop = asyncio.get_running_loop()
+                try:
+                    await self.blocking_call(imagerec.start_background_services)
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.blocking_call(imagerec.attendance_writer.stop)
+                self.encoders.shutdown(wait=False, cancel_futures=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def blocking_call(self, fn, *args):
+        return await self.loop.run_in_executor(self.blocking, fn, *args)
+
+    # Signal fired whenever a broadcaster or the event hub publishes
+    def signal_for(self, source):
+        signal = self._signals.get(id(source))
+        if signal is None:
+            signal = self._signals[id(source)] = LoopSignal(self.loop)
+            source.listeners.append(signal.notify)
+        return signal
+
+    async def send_json(self, send, data, status=200):
+        # Flask's JSON provider, so bodies match the Flask routes byte for byte
+        body = self.flask_app.json.response(data).get_data()
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'application/json')]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def video_feed(self, receive, send, query, camera_id=None):
+        if camera_id is None:
+            camera_id = imagerec.CAMERAS[0]['id']
+        elif camera_id not in {camera['id'] for camera in imagerec.CAMERAS}:
+            return await self.send_json(send, {'success': False, 'message': f'Unknown camera: {camera_id}'}, 404)
+        broadcaster = imagerec.get_broadcaster(camera_id)
+        variant = stream_variant(int_arg(query, 'width'), int_arg(query, 'quality'))
+        await self.stream(receive, send, MULTIPART_MIMETYPE, self.frames(broadcaster, variant))
+
+    async def frames(self, broadcaster, variant):
+        signal = self.signal_for(broadcaster)
+        broadcaster.join()
+        try:
+            seq = 0
+            while True:
+                event = signal.event
+                frame = broadcaster.latest()
+                if frame is None or frame.seq <= seq:
+                    await event.wait()
+                    continue
+                # Always the newest frame; a slow client just skips the ones
+                # published while it was still sending
+                seq = frame.seq
+                yield frame.cached(variant) or await self.encode(frame, variant)
+        finally:
+            broadcaster.leave()
+
+    async def registration_frames(self):
+        broker = get_broker(imagerec.REGISTRATION_SOURCE)
+        signal = self.signal_for(broker)
+        reader = None
+        try:
+            seq = 0
+            while True:
+                if not imagerec.registration_camera_running:
+                    # Give the device back while the preview is off
+                    if reader is not None:
+                        reader.release()
+                        reader = None
+                    await asyncio.sleep(0.1)
+                    continue
+                if reader is None:
+                    reader = broker.subscribe()
+                if broker.failed:
+                    print("Error: Could not open webcam for registration")
+                    return
+                event = signal.event
+                latest, img, captured_at = broker.latest()
+                if img is None or latest <= seq:
+                    try:
+                        await asyncio.wait_for(event.wait(), 0.5)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                seq = latest
+                yield await self.shared_job((broker, seq), imagerec.registration_part, img)
+        finally:
+            if reader is not None:
+                reader.release()
+
+    async def encode(self, frame, variant):
+        # Viewers that want the same variant of the same frame share one job
+        return await self.shared_job((frame, frame.key(variant)), frame.part, variant)
+
+    async def shared_job(self, key, fn, *args):
+        future = self._encoding.get(key)
+        if future is None:
+            future = self._encoding[key] = self.loop.run_in_executor(self.encoders, fn, *args)
+            future.add_done_callback(lambda f: self._encoding.pop(key, None))
+        # A disconnecting viewer must not cancel the job for everyone else
+        return await asyncio.shield(future)
+
+    async def event_stream(self, scope, receive, send):
+        last_id = None
+        for name, value in scope['headers']:
+            if name == b'last-event-id':
+                try:
+                    last_id = int(value)
+                except ValueError:
+                    pass
+        await self.stream(receive, send, 'text/event-stream; charset=utf-8', self.events(last_id), SSE_HEADERS)
+
+    async def events(self, last_id):
+        hub = imagerec.event_hub
+        signal = self.signal_for(hub)
+        last_id, prelude = hub.join(last_id)
+        try:
+            yield prelude.encode()
+            while True:
+                event = signal.event
+                last_id, text = hub.next_chunk(last_id, 0)
+                if text is None:
+                    try:
+                        await asyncio.wait_for(event.wait(), hub.keepalive)
+                        continue
+                    except asyncio.TimeoutError:
+                        text = KEEPALIVE
+                yield text.encode()
+        finally:
+            hub.leave()
+
+    async def stream(self, receive, send, content_type, chunks, headers=(), status=200, limited=True):
+        """Send ``chunks`` until they run out or the client goes away."""
+        if limited and self.streams >= self.max_streams:
+            await chunks.aclose()
+            await self.send_json(send, {'success': False, 'message': 'Too many open streams'}, 503)
+            return
+        self.streams += 1
+        try:
+            await send({'type': 'http.response.start', 'status': status,
+                        'headers': [(b'content-type', content_type.encode('latin-1'))] + list(headers)})
+
+            async def pump():
+                async for chunk in chunks:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                await send({'type': 'http.response.body', 'body': b''})
+
+            async def disconnected():
+                while (await receive())['type'] != 'http.disconnect':
+                    pass
+
+            tasks = [asyncio.ensure_future(pump()), asyncio.ensure_future(disconnected())]
+            try:
+                await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                for result in await asyncio.gather(*tasks, return_exceptions=True):
+                    if isinstance(result, Exception):
+                        print(f"Stream failed: {result}")
+        finally:
+            self.streams -= 1
+
+    async def wsgi(self, scope, receive, send):
+        """Serve a request with the Flask app on the bridge thread pool."""
+        body = io.BytesIO()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body.write(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        body.seek(0)
+
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                   for name, value in headers]
+            return body.write  # never used by Flask
+
+        result = await self.loop.run_in_executor(self.bridge, self.flask_app, wsgi_environ(scope, body),
+                                                 start_response)
+        headers = [header for header in response['headers'] if header[0] != b'content-type']
+        content_type = dict(response['headers']).get(b'content-type', b'text/html').decode('latin-1')
+        await self.stream(receive, send, content_type, self.wsgi_chunks(result), headers, response['status'],
+                          limited=False)
+
+    async def wsgi_chunks(self, result):
+        # Pull the response iterable on the bridge pool one chunk at a time,
+        # so streamed responses work too
+        iterator = iter(result)
+        future = None
+        try:
+            while True:
+                future = self.bridge.submit(next, iterator, None)
+                chunk = await asyncio.wrap_future(future)
+                if chunk is None:
+                    break
+                if chunk:
+                    yield chunk
+        finally:
+            close = getattr(result, 'close', None)
+            if close is not None:
+                # Closing runs the app's cleanup (releasing a camera), but
+                # only once the chunk being produced is finished
+                if future is not None and not future.done():
+                    future.add_done_callback(lambda f: self.bridge.submit(close))
+                else:
+                    self.bridge.submit(close)
+
+
+def arg(query, name, default=None):
+    values = query.get(name)
+    return values[0] if values else default
+
+
+# Like Flask's request.args.get(name, type=int): None when missing or not a number
+def int_arg(query, name):
+    try:
+        return int(arg(query, name))
+    except (TypeError, ValueError):
+        return None
+
+
+def wsgi_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        key = name.decode('latin-1').upper().replace('-', '_')
+        if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = f'HTTP_{key}'
+        value = value.decode('latin-1')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    # Chunked uploads arrive without a length, which WSGI apps rely on
+    environ.setdefault('CONTENT_LENGTH', str(body.getbuffer().nbytes))
+    return environ
+
+
+app = AsyncServer(imagerec.app)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the attendance app with an async (ASGI) server")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    args = parser.parse_args()
+
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("The async server needs uvicorn: pip install uvicorn")
+    # One process only: the cameras and the gallery live in this process
+    print("Starting async server...")
+    uvicorn.run(app, host=args.host, port=args.port, workers=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,549 @@
+import argparse
+import atexit
+import csv
+import glob
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+ATTENDANCE_COLUMNS = ['Name', 'Time', 'Date']
+
+
+def attendance_filename(date_str, directory='.'):
+    return os.path.join(directory, f'Attendance_{date_str}.csv')
+
+
+# Append rows to a daily attendance CSV, writing the header if the file is new
+def append_rows(filename, rows):
+    new_file = not os.path.isfile(filename)
+    with open(filename, 'a', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        if new_file:
+            writer.writerow(ATTENDANCE_COLUMNS)
+        writer.writerows(rows)
+
+
+def read_names(filename):
+    if not os.path.isfile(filename):
+        return set()
+    with open(filename, newline='', encoding='utf-8') as f:
+        return {row['Name'] for row in csv.DictReader(f) if row.get('Name')}
+
+
+def date_range(start_date, end_date):
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+    dates = []
+    current_date = start
+    while current_date <= end:
+        dates.append(current_date.strftime('%Y-%m-%d'))
+        current_date += timedelta(days=1)
+    return dates
+
+
+# The /api/report payload. Students are listed in the given order, with
+# ``present`` a student x date matrix of who was there on each of ``dates``.
+def report_payload(names, totals, present, dates, total_days):
+    dates = np.asarray(dates, dtype=object)
+    report = []
+    for name, total, row in zip(names, totals, present):
+        report.append({
+            'name': name,
+            'totalPresent': total,
+            'totalDays': total_days,
+            'percentage': round((total / total_days) * 100, 1),
+            'dates': dict.fromkeys(dates[row].tolist(), 'Present')
+        })
+    return report
+
+
+# Build the /api/report payload from (date, name) rows in date order
+def build_report(rows, total_days):
+    students = {}
+    dates = {}
+    codes = [(students.setdefault(name, len(students)), dates.setdefault(date_str, len(dates)))
+             for date_str, name in rows]
+    if not codes:
+        return []
+    codes = np.array(codes)
+    present = np.zeros((len(students), len(dates)), dtype=bool)
+    present[codes[:, 0], codes[:, 1]] = True
+    totals = np.bincount(codes[:, 0], minlength=len(students))
+    return report_payload(list(students), totals.tolist(), present, list(dates), total_days)
+
+
+# Vectorised equivalent of build_report for a frame of Name/Date rows in date order
+def report_from_frame(df, total_days):
+    if df.empty:
+        return []
+    # factorize numbers students in order of first appearance, as build_report
+    # lists them, and the dates in order because the rows are sorted by date
+    name_codes, names = pd.factorize(df['Name'])
+    date_codes, dates = pd.factorize(df['Date'])
+    totals = np.bincount(name_codes, minlength=len(names))
+
+    # Student x date presence matrix
+    present = np.zeros((len(names), len(dates)), dtype=bool)
+    present[name_codes, date_codes] = True
+    return report_payload(names.tolist(), totals.tolist(), present, dates, total_days)
+
+
+class CsvAttendanceStore:
+    """Attendance kept as one ``Attendance_<date>.csv`` file per day."""
+
+    def __init__(self, directory='.'):
+        self.directory = directory
+        self._dirty = set()
+
+    def names_for_date(self, date_str):
+        return read_names(attendance_filename(date_str, self.directory))
+
+    def append(self, rows):
+        by_date = {}
+        for row in rows:
+            by_date.setdefault(row[2], []).append(row)
+        for date_str, date_rows in by_date.items():
+            filename = attendance_filename(date_str, self.directory)
+            append_rows(filename, date_rows)
+            self._dirty.add(filename)
+
+    def sync(self):
+        for filename in self._dirty:
+            with open(filename, 'rb+') as f:
+                os.fsync(f.fileno())
+        self._dirty.clear()
+
+    # Changes whenever the day's file is written; None if there is no file
+    def day_version(self, date_str):
+        try:
+            st = os.stat(attendance_filename(date_str, self.directory))
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    # Names in row order, as the report counts them
+    def day_names(self, date_str):
+        filename = attendance_filename(date_str, self.directory)
+        if not os.path.isfile(filename):
+            return []
+        return pd.read_csv(filename, usecols=['Name'])['Name'].dropna().tolist()
+
+    def records_for_date(self, date_str):
+        filename = attendance_filename(date_str, self.directory)
+        if not os.path.isfile(filename):
+            return []
+        df = pd.read_csv(filename)
+        return [{'name': row['Name'], 'time': row['Time'], 'status': 'Present'} for _, row in df.iterrows()]
+
+    def report(self, start_date, end_date):
+        all_dates = date_range(start_date, end_date)
+        dates = [d for d in all_dates if os.path.isfile(attendance_filename(d, self.directory))]
+
+        # Read the daily files concurrently and stack them into one frame
+        with ThreadPoolExecutor(max_workers=min(8, len(dates) or 1)) as executor:
+            frames = list(executor.map(
+                lambda d: pd.read_csv(attendance_filename(d, self.directory), usecols=['Name']), dates))
+        if not frames:
+            return []
+        df = pd.DataFrame({
+            'Name': pd.concat([frame['Name'] for frame in frames], ignore_index=True),
+            'Date': np.repeat(dates, [len(frame) for frame in frames]),
+        }).dropna(subset=['Name'])
+        return report_from_frame(df, len(all_dates))
+
+
+class SqliteAttendanceStore:
+    """Attendance in an embedded SQLite database indexed by date and name.
+
+    Lookups for a day or a date range are index range scans, so their cost
+    follows the rows returned rather than the number of days on record. With
+    ``export_csv`` every row is also appended to the daily CSV file so tools
+    that read those keep working.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS attendance (
+            name TEXT NOT NULL,
+            time TEXT NOT NULL,
+            date TEXT NOT NULL,
+            UNIQUE (date, name)
+        );
+        CREATE INDEX IF NOT EXISTS attendance_name ON attendance (name, date);
+    """
+
+    def __init__(self, path='attendance.db', directory='.', export_csv=True):
+        self.path = path
+        self.directory = directory
+        self.csv_store = CsvAttendanceStore(directory) if export_csv else None
+        # sqlite3 connections cannot be shared between threads
+        self._local = threading.local()
+        with self._connect() as db:
+            db.executescript(self.SCHEMA)
+
+    def _connect(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path)
+            db.execute('PRAGMA journal_mode=WAL')
+            self._local.db = db
+        return db
+
+    def names_for_date(self, date_str):
+        cursor = self._connect().execute('SELECT name FROM attendance WHERE date = ?', (date_str,))
+        return {name for (name,) in cursor}
+
+    def append(self, rows):
+        # Only rows the UNIQUE constraint let through are mirrored, so the
+        # CSV never gets a second row for someone already marked that day
+        inserted = []
+        with self._connect() as db:
+            for row in rows:
+                if db.execute('INSERT OR IGNORE INTO attendance (name, time, date) VALUES (?, ?, ?)', row).rowcount:
+                    inserted.append(row)
+        if self.csv_store is not None and inserted:
+            self.csv_store.append(inserted)
+
+    def sync(self):
+        if self.csv_store is not None:
+            self.csv_store.sync()
+
+    def day_version(self, date_str):
+        return self._connect().execute(
+            'SELECT COUNT(*), MAX(rowid) FROM attendance WHERE date = ?', (date_str,)).fetchone()
+
+    def day_names(self, date_str):
+        cursor = self._connect().execute(
+            'SELECT name FROM attendance WHERE date = ? ORDER BY rowid', (date_str,))
+        return [name for (name,) in cursor]
+
+    def records_for_date(self, date_str):
+        cursor = self._connect().execute(
+            'SELECT name, time FROM attendance WHERE date = ? ORDER BY rowid', (date_str,))
+        return [{'name': name, 'time': time_str, 'status': 'Present'} for name, time_str in cursor]
+
+    def report(self, start_date, end_date):
+        cursor = self._connect().execute(
+            'SELECT date, name FROM attendance WHERE date BETWEEN ? AND ? ORDER BY date, rowid',
+            (start_date, end_date))
+        return build_report(cursor, len(date_range(start_date, end_date)))
+
+    # One-shot import of the existing daily CSV files; rows already present are skipped
+    def import_csv(self, directory='.'):
+        imported = 0
+        for filename in sorted(glob.glob(os.path.join(directory, 'Attendance_*.csv'))):
+            with open(filename, newline='', encoding='utf-8') as f:
+                rows = [(row['Name'], row['Time'], row['Date']) for row in csv.DictReader(f) if row.get('Name')]
+            with self._connect() as db:
+                before = db.total_changes
+                db.executemany('INSERT OR IGNORE INTO attendance (name, time, date) VALUES (?, ?, ?)', rows)
+                imported += db.total_changes - before
+        return imported
+
+    def export_csv(self, date_str, directory='.'):
+        filename = attendance_filename(date_str, directory)
+        cursor = self._connect().execute(
+            'SELECT name, time, date FROM attendance WHERE date = ? ORDER BY rowid', (date_str,))
+        with open(filename, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f, lineterminator='\n')
+            writer.writerow(ATTENDANCE_COLUMNS)
+            writer.writerows(cursor)
+        return filename
+
+
+class AttendanceSummaryCache:
+    """Each day's attendance kept in memory so repeated range reports skip the store.
+
+    A day is stored as an array of student ids in row order, next to the
+    store's ``day_version`` at the time it was read. Every report compares
+    the versions (a stat or an indexed count per day) and re-reads only the
+    days that moved, which covers today's new rows, the day that was "today"
+    when it was cached, and past days written later by ``batch.py`` or an
+    import. Reports then work on integer arrays and read no rows for
+    unchanged days.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._ids = {}
+        self._names = []
+        self._days = {}
+        self._lock = threading.Lock()
+
+    def _id(self, name):
+        student = self._ids.get(name)
+        if student is None:
+            student = self._ids[name] = len(self._names)
+            self._names.append(name)
+        return student
+
+    def _load(self, date_str):
+        return date_str, self.store.day_version(date_str), self.store.day_names(date_str)
+
+    def _days_for(self, dates):
+        days = self._days
+        stale = [d for d in dates if d not in days or days[d][0] != self.store.day_version(d)]
+
+        if stale:
+            with ThreadPoolExecutor(max_workers=min(8, len(stale))) as executor:
+                loaded = list(executor.map(self._load, stale))
+            with self._lock:
+                for date_str, version, names in loaded:
+                    ids = np.fromiter(map(self._id, names), dtype=np.int64, count=len(names))
+                    self._days[date_str] = (version, ids)
+
+        return [(d, days[d][1]) for d in dates]
+
+    def report(self, start_date, end_date):
+        all_dates = date_range(start_date, end_date)
+        days = [(d, ids) for d, ids in self._days_for(all_dates) if len(ids)]
+        if not days:
+            return []
+
+        codes = np.concatenate([ids for _, ids in days])
+        day_codes = np.repeat(np.arange(len(days)), [len(ids) for _, ids in days])
+
+        # Number the students in order of first appearance, as build_report
+        # does; everything here is O(rows) over small integer ids
+        totals = np.bincount(codes, minlength=len(self._names))
+        first_seen = np.full(len(totals), len(codes))
+        np.minimum.at(first_seen, codes, np.arange(len(codes)))
+        students = np.flatnonzero(totals)
+        students = students[np.argsort(first_seen[students])]
+        local = np.empty(len(totals), dtype=np.intp)
+        local[students] = np.arange(len(students))
+
+        present = np.zeros((len(students), len(days)), dtype=bool)
+        present[local[codes], day_codes] = True
+        return report_payload([self._names[student] for student in students.tolist()],
+                              totals[students].tolist(), present, [d for d, _ in days], len(all_dates))
+
+
+def make_store(backend='csv', **options):
+    if backend == 'csv':
+        return CsvAttendanceStore(**options)
+    if backend == 'sqlite':
+        return SqliteAttendanceStore(**options)
+    raise ValueError(f"Unknown attendance backend '{backend}', expected 'csv' or 'sqlite'")
+
+
+class AttendanceLedger:
+    """Who has been marked present today, kept in memory for the whole process.
+
+    Today's names are read from ``store`` once, when the ledger first sees the
+    date, and after that "already marked" is a set lookup. The date is checked on every call,
+    so the set starts over at midnight. A new person costs one appended row,
+    handed to ``writer`` when one is given and written inline otherwise.
+    """
+
+    def __init__(self, store=None, writer=None):
+        self.store = store if store is not None else CsvAttendanceStore()
+        self.writer = writer
+        self.date = None
+        self.present = set()
+        self._lock = threading.Lock()
+
+    def _roll_over(self, date_str):
+        if date_str != self.date:
+            self.present = self.store.names_for_date(date_str)
+            self.date = date_str
+
+    # How many people are marked today, including rows the writer has not
+    # flushed yet
+    def present_count(self, now=None):
+        now = now or datetime.now()
+        with self._lock:
+            self._roll_over(now.strftime('%Y-%m-%d'))
+            return len(self.present)
+
+    def mark(self, name, now=None):
+        now = now or datetime.now()
+        dateString = now.strftime('%Y-%m-%d')
+        timeString = now.strftime('%H:%M:%S')
+
+        with self._lock:
+            self._roll_over(dateString)
+            if name in self.present:
+                return f"{name} - Already Marked"
+            self.present.add(name)
+            row = (name, timeString, dateString)
+            if self.writer is None:
+                self.store.append([row])
+            elif not self.writer.submit(row):
+                # The writer is backed up; forget the mark so a later frame
+                # retries it instead of losing the row
+                self.present.discard(name)
+                return f"{name} - Pending"
+        return f"{name} - Marked"
+
+
+class AttendanceWriter:
+    """Background thread that appends attendance rows to the attendance store.
+
+    Rows arrive through a bounded queue and ``submit`` never blocks. The thread
+    writes them in batches every ``flush_interval`` seconds (or sooner once
+    ``max_batch`` rows are waiting). Each batch is appended to a journal before
+    the store; with ``fsync='batch'`` the journal is fsynced per batch and the
+    store at every checkpoint, after which the journal is cleared.
+    ``fsync='none'`` leaves durability to the OS. On start, rows left in the
+    journal by a crash are replayed into the store if it is missing them.
+    A batch the store fails to take (a locked database, a full disk) is kept
+    and retried every ``flush_interval``; the journal is only cleared once
+    the store has every row.
+    """
+
+    def __init__(self, store=None, journal='attendance.journal', flush_interval=1.0,
+                 max_batch=256, queue_size=1024, fsync='batch', checkpoint_interval=60.0):
+        if fsync not in ('batch', 'none'):
+            raise ValueError(f"Unknown fsync policy '{fsync}', expected 'batch' or 'none'")
+        self.store = store if store is not None else CsvAttendanceStore()
+        self.journal = journal
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.fsync = fsync
+        self.checkpoint_interval = checkpoint_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._thread = None
+        self._failed = []
+
+    def submit(self, row):
+        # Rows handed to a writer that is not running would never be written
+        if self._thread is None or not self._thread.is_alive():
+            print("Attendance writer is not running, row deferred")
+            return False
+        try:
+            self.queue.put_nowait(row)
+            return True
+        except queue.Full:
+            print("Attendance writer queue is full, row deferred")
+            return False
+
+    def start(self):
+        self.replay()
+        self._thread = threading.Thread(target=self._run, name='attendance-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def replay(self):
+        if not os.path.isfile(self.journal):
+            return
+        with open(self.journal, newline='', encoding='utf-8') as f:
+            rows = [tuple(row) for row in csv.reader(f) if len(row) == 3]
+
+        missing = self._missing(rows)
+        if missing:
+            self.store.append(missing)
+            print(f"Replayed {len(missing)} attendance rows from {self.journal}")
+        self._checkpoint()
+
+    # The rows the store does not have yet, so a retried or replayed batch
+    # that was partly written does not add anyone twice
+    def _missing(self, rows):
+        missing = []
+        existing = {}
+        for row in rows:
+            if row[2] not in existing:
+                existing[row[2]] = self.store.names_for_date(row[2])
+            if row[0] not in existing[row[2]]:
+                existing[row[2]].add(row[0])
+                missing.append(row)
+        return missing
+
+    def _run(self):
+        last_checkpoint = time.monotonic()
+        while not self._stop.is_set() or not self.queue.empty():
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0 or (self._stop.is_set() and self.queue.empty()):
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=min(timeout, 0.1)))
+                except queue.Empty:
+                    continue
+
+            self._retry_failed()
+            if batch:
+                self._write_batch(batch)
+            if time.monotonic() - last_checkpoint >= self.checkpoint_interval:
+                self._checkpoint()
+                last_checkpoint = time.monotonic()
+        self._retry_failed()
+        self._checkpoint()
+
+    def _write_batch(self, batch):
+        try:
+            with open(self.journal, 'a', newline='', encoding='utf-8') as f:
+                csv.writer(f, lineterminator='\n').writerows(batch)
+                if self.fsync == 'batch':
+                    f.flush()
+                    os.fsync(f.fileno())
+        except OSError as e:
+            # The store write still goes ahead; these rows just are not
+            # covered by crash replay
+            print(f"Failed to journal {len(batch)} attendance rows: {e}")
+        try:
+            self.store.append(batch)
+        except Exception as e:
+            print(f"Failed to write {len(batch)} attendance rows, retrying: {e}")
+            self._failed.extend(batch)
+
+    # Rows the store refused earlier, oldest first
+    def _retry_failed(self):
+        if not self._failed:
+            return
+        try:
+            self.store.append(self._missing(self._failed))
+        except Exception as e:
+            print(f"Retrying {len(self._failed)} attendance rows failed: {e}")
+            return
+        self._failed = []
+
+    # Make the store durable, then the journal entries are no longer needed
+    def _checkpoint(self):
+        if self._failed:
+            return
+        try:
+            if self.fsync == 'batch':
+                self.store.sync()
+            if os.path.isfile(self.journal):
+                os.remove(self.journal)
+        except Exception as e:
+            print(f"Attendance checkpoint failed, keeping the journal: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage the SQLite attendance store')
+    parser.add_argument('command', choices=['import', 'export'])
+    parser.add_argument('--db', default='attendance.db', help='SQLite database file')
+    parser.add_argument('--dir', default='.', help='folder with the Attendance_<date>.csv files')
+    parser.add_argument('--date', action='append', default=[],
+                        help='with export, date to write as CSV (repeatable)')
+    args = parser.parse_args()
+
+    store = SqliteAttendanceStore(args.db, args.dir, export_csv=False)
+    if args.command == 'import':
+        print(f"Imported {store.import_csv(args.dir)} rows into {args.db}")
+    else:
+        for date_str in args.date:
+            print(f"Wrote {store.export_csv(date_str, args.dir)}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
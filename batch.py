@@ -0,0 +1,215 @@
+"""Take attendance from recorded lectures and photo folders instead of a live camera.
+
+Every ``--stride``-th video frame and every photo is run through the
+same shrink / detect / encode / match steps as the live pipeline, and
+everyone recognised is marked present in the usual Attendance_<date>.csv,
+timed at their first sighting. Videos are cut into frame ranges and photo
+folders into batches, and the pieces are decoded and recognised in parallel
+across processes.
+
+    python batch.py lecture.mp4 --start "2025-03-03 09:00:00" --stride 15
+    python batch.py recordings/*.mp4 snapshots/ --workers 8 --dry-run
+"""
+import argparse
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+import cv2
+import face_recognition
+
+from attendance import AttendanceLedger, make_store
+from gallery import CACHE_PATH, IMAGE_EXTENSIONS, IMAGES_PATH, EncodingCache, GalleryMatrix
+from pipeline import shrink_frame
+
+# Frame ranges per worker; more pieces than workers evens out slow ones
+CHUNKS_PER_WORKER = 4
+
+# Set in each worker process by init_worker
+worker_gallery = None
+worker_tolerance = 0.6
+
+
+def init_worker(names, encodings, tolerance):
+    global worker_gallery, worker_tolerance
+    worker_gallery = GalleryMatrix(names, encodings)
+    worker_tolerance = tolerance
+
+
+# Names recognised in one BGR frame, the way the live pipeline matches them
+def recognize(img):
+    small = shrink_frame(img)
+    boxes = face_recognition.face_locations(small)
+    if not boxes:
+        return []
+    encodings = face_recognition.face_encodings(small, boxes)
+    gallery = worker_gallery.snapshot
+    matchIndexes, faceDis = gallery.search(encodings)
+    return [gallery.names[i].upper() for i, distance in zip(matchIndexes, faceDis) if distance <= worker_tolerance]
+
+
+def note(sightings, names, when, source):
+    for name in names:
+        if name not in sightings or when < sightings[name][0]:
+            sightings[name] = (when, source)
+
+
+# Recognise every stride-th frame in [first, last) of a video. Frames in
+# between are only grabbed, which skips the colour conversion and copy.
+def process_video(path, first, last, stride, fps, started):
+    sightings = {}
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        print(f"Could not open video: {path}")
+        return sightings, 0, 0.0
+    if first:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, first)
+    index, sampled = first, 0
+    try:
+        while index < last:
+            if index % stride == 0:
+                success, img = cap.read()
+                if not success:
+                    break
+                sampled += 1
+                note(sightings, recognize(img), started + timedelta(seconds=index / fps), path)
+            elif not cap.grab():
+                break
+            index += 1
+    finally:
+        cap.release()
+    return sightings, sampled, (index - first) / fps
+
+
+def process_images(paths, started):
+    sightings = {}
+    for path in paths:
+        img = cv2.imread(path)
+        if img is None:
+            print(f"Could not read image: {path}")
+            continue
+        when = started or datetime.fromtimestamp(os.path.getmtime(path))
+        note(sightings, recognize(img), when, path)
+    return sightings, len(paths), 0.0
+
+
+def process_task(task):
+    kind, args = task
+    if kind == 'video':
+        return process_video(*args)
+    return process_images(*args)
+
+
+# Split the inputs into tasks: frame ranges of each video (aligned to the
+# stride) and batches of each photo folder
+def plan_tasks(inputs, stride, workers, started):
+    tasks = []
+    for path in inputs:
+        if os.path.isdir(path):
+            # Photos are separate shots, so the frame stride does not apply
+            files = sorted(os.path.join(path, f) for f in os.listdir(path) if f.lower().endswith(IMAGE_EXTENSIONS))
+            size = max(1, -(-len(files) // (workers * CHUNKS_PER_WORKER)))
+            for i in range(0, len(files), size):
+                tasks.append(('images', (files[i:i + size], started)))
+            continue
+
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            print(f"Skipping {path}: not a readable video or folder")
+            continue
+        frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        cap.release()
+        # Without a start time, assume the recording ended when the file was
+        # last written
+        video_start = started
+        if video_start is None:
+            video_start = datetime.fromtimestamp(os.path.getmtime(path)) - timedelta(seconds=max(frames, 0) / fps)
+        if frames <= 0:
+            # Unknown length (some containers and streams): one sequential pass
+            tasks.append(('video', (path, 0, float('inf'), stride, fps, video_start)))
+            continue
+        size = -(-frames // (workers * CHUNKS_PER_WORKER))
+        size = max(stride, -(-size // stride) * stride)
+        for first in range(0, frames, size):
+            tasks.append(('video', (path, first, min(first + size, frames), stride, fps, video_start)))
+    return tasks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('inputs', nargs='+', help='video files and/or folders of photos')
+    parser.add_argument('--stride', type=int, default=10, help='recognise every Nth video frame')
+    parser.add_argument('--workers', type=int, default=None, help='processes (default: all cores)')
+    parser.add_argument('--start', default=None,
+                        help='"YYYY-MM-DD HH:MM:SS" the recordings started (default: from file times)')
+    parser.add_argument('--tolerance', type=float, default=0.6, help='maximum face distance for a match')
+    parser.add_argument('--images', default=IMAGES_PATH, help='gallery folder')
+    parser.add_argument('--cache', default=CACHE_PATH, help='encoding cache path without extension')
+    parser.add_argument('--backend', choices=['csv', 'sqlite'], default='csv', help='attendance store')
+    parser.add_argument('--dir', default='.', help='folder for the Attendance_<date>.csv files')
+    parser.add_argument('--db', default='attendance.db', help='with --backend sqlite, database file')
+    parser.add_argument('--dry-run', action='store_true', help='print who was seen without marking anyone')
+    args = parser.parse_args()
+
+    stride = max(1, args.stride)
+    workers = args.workers or os.cpu_count() or 1
+    started = datetime.strptime(args.start, '%Y-%m-%d %H:%M:%S') if args.start else None
+
+    cache = EncodingCache(args.images, args.cache)
+    cache.load()
+    names, encodings = cache.sync()
+    if not names:
+        print(f"No registered faces in {args.images}")
+        return 1
+
+    # Open the attendance store before the long part, so a bad --dir or
+    # --db fails now rather than after every video has been processed
+    ledger = None
+    if not args.dry_run:
+        try:
+            os.makedirs(args.dir, exist_ok=True)
+            options = {'path': args.db, 'directory': args.dir} if args.backend == 'sqlite' else {'directory': args.dir}
+            store = make_store(args.backend, **options)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Cannot write attendance to {args.dir}: {e}")
+            return 1
+        ledger = AttendanceLedger(store)
+
+    tasks = plan_tasks(args.inputs, stride, workers, started)
+    if not tasks:
+        print("Nothing to process")
+        return 1
+
+    sightings = {}
+    sampled, covered = 0, 0.0
+    begin = time.time()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(names, encodings, args.tolerance)) as executor:
+        futures = [executor.submit(process_task, task) for task in tasks]
+        for done, future in enumerate(as_completed(futures), 1):
+            found, frames, seconds = future.result()
+            for name, (when, source) in found.items():
+                note(sightings, [name], when, source)
+            sampled += frames
+            covered += seconds
+            elapsed = time.time() - begin
+            speed = f", {covered / elapsed:.1f}x real time" if covered and elapsed else ''
+            print(f"Processed {done}/{len(tasks)} pieces: {sampled} frames, "
+                  f"{len(sightings)} people ({elapsed:.1f}s{speed})")
+
+    if ledger is None:
+        for name, (when, source) in sorted(sightings.items(), key=lambda item: item[1][0]):
+            print(f"{name}: first seen {when:%Y-%m-%d %H:%M:%S} in {source}")
+        return 0
+
+    for name, (when, source) in sorted(sightings.items(), key=lambda item: item[1][0]):
+        print(ledger.mark(name, when))
+    store.sync()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,124 @@
+"""Benchmark get_attendance_report over synthetic multi-year CSV history.
+
+Writes one Attendance_<date>.csv per day for the requested number of years
+and students into a temporary folder, then times the original row-by-row
+report against CsvAttendanceStore.report and AttendanceSummaryCache (first
+and repeated requests) and checks they all give the same JSON.
+
+    python benchmarks/bench_report.py --years 3 --students 2000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from attendance import AttendanceSummaryCache, CsvAttendanceStore, attendance_filename  # noqa: E402
+
+
+# The report as imagerec.py computed it before it was vectorised
+def legacy_report(directory, start_date, end_date):
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+    report = {}
+    all_dates = {}
+    current_date = start
+    while current_date <= end:
+        all_dates[current_date.strftime('%Y-%m-%d')] = True
+        current_date += timedelta(days=1)
+
+    current_date = start
+    while current_date <= end:
+        date_str = current_date.strftime('%Y-%m-%d')
+        filename = attendance_filename(date_str, directory)
+        if os.path.isfile(filename):
+            df = pd.read_csv(filename)
+            for _, row in df.iterrows():
+                name = row['Name']
+                if name not in report:
+                    report[name] = {
+                        'name': name,
+                        'totalPresent': 0,
+                        'totalDays': len(all_dates),
+                        'percentage': 0,
+                        'dates': {}
+                    }
+                report[name]['dates'][date_str] = 'Present'
+                report[name]['totalPresent'] += 1
+        current_date += timedelta(days=1)
+
+    for student in report.values():
+        student['percentage'] = round((student['totalPresent'] / student['totalDays']) * 100, 1)
+    return list(report.values())
+
+
+def write_history(directory, start, days, students, rate, seed=0):
+    rng = np.random.default_rng(seed)
+    names = np.array([f'STUDENT{i:05d}' for i in range(students)])
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        if day.weekday() >= 5:
+            continue
+        date_str = day.strftime('%Y-%m-%d')
+        present = rng.permutation(names[rng.random(students) < rate])
+        seconds = np.sort(rng.integers(8 * 3600, 10 * 3600, len(present)))
+        times = [f'{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}' for s in seconds]
+        pd.DataFrame({'Name': present, 'Time': times, 'Date': date_str}).to_csv(
+            attendance_filename(date_str, directory), index=False)
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--years', type=int, default=2)
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--rate', type=float, default=0.85, help='chance a student is present on a weekday')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--skip-legacy', action='store_true', help='only time the current report')
+    args = parser.parse_args()
+
+    start = datetime(2022, 1, 3)
+    days = 365 * args.years
+    end = start + timedelta(days=days - 1)
+    start_date, end_date = start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"Writing {days} days x {args.students} students...")
+        write_history(directory, start, days, args.students, args.rate)
+
+        results = {'years': args.years, 'students': args.students, 'days': days}
+        store = CsvAttendanceStore(directory)
+        results['report_s'], current = timed(lambda: store.report(start_date, end_date), args.repeat)
+
+        summaries = AttendanceSummaryCache(store)
+        results['cached_report_cold_s'], cached = timed(lambda: summaries.report(start_date, end_date), 1)
+        results['cached_report_warm_s'], _ = timed(lambda: summaries.report(start_date, end_date), args.repeat)
+        identical = json.dumps(cached) == json.dumps(current)
+
+        if not args.skip_legacy:
+            results['legacy_report_s'], expected = timed(
+                lambda: legacy_report(directory, start_date, end_date), 1)
+            results['speedup'] = round(results['legacy_report_s'] / results['report_s'], 1)
+            identical = identical and json.dumps(current) == json.dumps(expected)
+        results['identical'] = identical
+
+    print(json.dumps(results, indent=2))
+    return 0 if identical else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,323 @@
+"""Benchmark the recognition and attendance hot paths without a camera.
+
+Sections (all run by default, pick some with --only):
+
+    encodings  findEncodings and the encoding cache on galleries built from
+               the bundled photos
+    frame      shrink / detect / encode / match latency for 1-20 faces per frame
+    match      gallery search throughput against 1k-100k random encodings
+    mark       markAttendance for new and already-marked names
+    report     get_attendance_report over long synthetic histories
+
+Everything runs in a temporary working directory, so the real gallery, cache
+and attendance files are never touched. Results come out as JSON (stdout, or
+--output); --compare prints the ratio of every timing against an earlier run.
+
+    python benchmarks/bench_suite.py --output before.json
+    python benchmarks/bench_suite.py --compare before.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import cv2
+import numpy as np
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, REPO)
+import face_recognition  # noqa: E402
+from attendance import AttendanceLedger, CsvAttendanceStore  # noqa: E402
+from bench_report import timed, write_history  # noqa: E402
+from gallery import EncodingCache, GalleryMatrix, make_index  # noqa: E402
+from pipeline import shrink_frame  # noqa: E402
+
+SECTIONS = ('encodings', 'frame', 'match', 'mark', 'report')
+
+
+def samples(fn, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def latency_ms(durations):
+    return {'median_ms': round(float(np.median(durations)) * 1000, 3),
+            'p95_ms': round(float(np.percentile(durations, 95)) * 1000, 3)}
+
+
+def load_photos():
+    folder = os.path.join(REPO, 'ImagesAttendance')
+    photos = []
+    for name in sorted(os.listdir(folder)):
+        img = cv2.imread(os.path.join(folder, name))
+        if img is not None:
+            photos.append(img)
+    if not photos:
+        raise SystemExit(f"No photos found in {folder}")
+    return photos
+
+
+# A gallery of ``size`` images made by varying the bundled photos (mirror,
+# brightness, scale), so every image is different and has to be encoded
+def synthetic_gallery(photos, size):
+    images = []
+    for i in range(size):
+        img = photos[i % len(photos)]
+        variant = i // len(photos)
+        if variant % 2:
+            img = cv2.flip(img, 1)
+        img = cv2.convertScaleAbs(img, alpha=1.0 + 0.04 * (variant % 5 - 2), beta=variant % 7)
+        scale = 1.0 - 0.03 * (variant % 4)
+        if scale != 1.0:
+            img = cv2.resize(img, (0, 0), None, scale, scale)
+        images.append(img)
+    return images
+
+
+# A camera frame with ``faces`` photos laid out on a grid, and the photo
+# boxes as (top, right, bottom, left) in the quarter-size frame
+def composite_frame(photos, faces, tile=320):
+    cols = int(np.ceil(np.sqrt(faces)))
+    rows = int(np.ceil(faces / cols))
+    frame = np.full((rows * tile, cols * tile, 3), 90, dtype=np.uint8)
+    boxes = []
+    for i in range(faces):
+        r, c = divmod(i, cols)
+        frame[r * tile:(r + 1) * tile, c * tile:(c + 1) * tile] = cv2.resize(photos[i % len(photos)], (tile, tile))
+        q = tile // 4
+        top, left = r * q, c * q
+        boxes.append((top + q // 5, left + q * 4 // 5, top + q * 4 // 5, left + q // 5))
+    return frame, boxes
+
+
+def random_gallery(size, seed=0):
+    rng = np.random.default_rng(seed)
+    encodings = rng.normal(scale=0.05, size=(size, 128))
+    return [f'STUDENT{i:06d}' for i in range(size)], encodings
+
+
+def bench_encodings(imagerec, photos, sizes, repeat):
+    results = []
+    for size in sizes:
+        images = synthetic_gallery(photos, size)
+        serial_s, encodings = timed(lambda: imagerec.findEncodings(images, workers=1), repeat)
+        parallel_s, _ = timed(lambda: imagerec.findEncodings(images, workers=None), repeat)
+
+        # Startup through the on-disk cache: everything new, then nothing changed
+        folder = os.path.abspath(f'gallery_{size}')
+        os.makedirs(folder, exist_ok=True)
+        for i, img in enumerate(images):
+            cv2.imwrite(os.path.join(folder, f'PERSON{i:05d}.jpg'), img)
+        cache_path = os.path.join(folder, 'cache')
+        cold_s, _ = timed(lambda: EncodingCache(folder, cache_path).sync(workers=None), 1)
+
+        def warm():
+            cache = EncodingCache(folder, cache_path)
+            cache.load()
+            return cache.sync(workers=None)
+        warm_s, _ = timed(warm, repeat)
+        shutil.rmtree(folder)
+
+        results.append({'label': f'images={size}', 'images': size, 'encoded': len(encodings),
+                        'serial_s': serial_s, 'parallel_s': parallel_s,
+                        'serial_per_image_ms': round(serial_s / size * 1000, 3),
+                        'cache_cold_s': cold_s, 'cache_warm_s': warm_s})
+    return results
+
+
+def bench_frame(photos, face_counts, gallery_size, repeat):
+    gallery = GalleryMatrix(*random_gallery(gallery_size))
+    results = []
+    for faces in face_counts:
+        frame, boxes = composite_frame(photos, faces)
+        small = shrink_frame(frame)
+        found = face_recognition.face_locations(small)
+        encodings = face_recognition.face_encodings(small, boxes)
+
+        stages = {
+            'shrink': samples(lambda: shrink_frame(frame), repeat),
+            'detect': samples(lambda: face_recognition.face_locations(small), repeat),
+            # Encode the known photo boxes so the count is exact even when
+            # the detector misses a face
+            'encode': samples(lambda: face_recognition.face_encodings(small, boxes), repeat),
+            'match': samples(lambda: gallery.snapshot.search(encodings), repeat),
+        }
+        total = [sum(parts) for parts in zip(*stages.values())]
+        entry = {'label': f'faces={faces}', 'faces': faces, 'detected': len(found),
+                 'frame': f'{frame.shape[1]}x{frame.shape[0]}', 'gallery': gallery_size}
+        for stage, durations in stages.items():
+            entry[stage] = latency_ms(durations)
+        entry['total'] = latency_ms(total)
+        results.append(entry)
+    return results
+
+
+def bench_match(sizes, batches, indexes, repeat):
+    rng = np.random.default_rng(1)
+    results = []
+    for size in sizes:
+        names, encodings = random_gallery(size)
+        for backend in indexes:
+            build_s, gallery = timed(lambda: GalleryMatrix(names, encodings, index=make_index(backend)), 1)
+            for batch in batches:
+                rows = rng.choice(size, batch)
+                queries = encodings[rows] + rng.normal(scale=0.03, size=(batch, 128))
+                search_s, (best, _) = timed(lambda: gallery.snapshot.search(queries), repeat)
+                results.append({'label': f'gallery={size},index={backend},batch={batch}',
+                                'gallery': size, 'index': backend, 'batch': batch,
+                                'build_s': build_s, 'search_s': search_s,
+                                'per_query_us': round(search_s / batch * 1e6, 2),
+                                'queries_per_sec': round(batch / search_s),
+                                'hit_rate': float(np.mean(np.asarray(best) == rows))})
+    return results
+
+
+def bench_mark(imagerec, count):
+    names = [f'STUDENT{i:05d}' for i in range(count)]
+    results = []
+
+    # The app's path: in-memory ledger, background writer, dashboard push
+    imagerec.attendance_writer.start()
+    new_s, statuses = timed(lambda: [imagerec.markAttendance(name) for name in names], 1)
+    repeat_s, _ = timed(lambda: [imagerec.markAttendance(name) for name in names], 1)
+    imagerec.attendance_writer.stop()
+    results.append({'label': 'markAttendance', 'marks': count,
+                    'new_per_call_us': round(new_s / count * 1e6, 2),
+                    'repeat_per_call_us': round(repeat_s / count * 1e6, 2),
+                    'pending': sum(status.endswith('Pending') for status in statuses)})
+
+    # The ledger writing each row inline, without the background writer
+    os.makedirs('inline', exist_ok=True)
+    ledger = AttendanceLedger(CsvAttendanceStore('inline'))
+    new_s, _ = timed(lambda: [ledger.mark(name) for name in names], 1)
+    repeat_s, _ = timed(lambda: [ledger.mark(name) for name in names], 1)
+    results.append({'label': 'ledger_inline', 'marks': count,
+                    'new_per_call_us': round(new_s / count * 1e6, 2),
+                    'repeat_per_call_us': round(repeat_s / count * 1e6, 2)})
+    return results
+
+
+def bench_report(imagerec, years, students, repeat):
+    start = datetime(2022, 1, 3)
+    days = 365 * years
+    write_history('.', start, days, students, rate=0.85)
+    end = start + timedelta(days=days - 1)
+
+    # Ranges share the per-day summary cache, so cold_s is the first request
+    # for a range after the shorter ones warmed part of it
+    results = []
+    for label, first in (('30d', end - timedelta(days=29)), ('1y', end - timedelta(days=364)), ('all', start)):
+        start_date, end_date = first.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
+        cold_s, report = timed(lambda: imagerec.get_attendance_report(start_date, end_date), 1)
+        warm_s, _ = timed(lambda: imagerec.get_attendance_report(start_date, end_date), repeat)
+        results.append({'label': f'range={label}', 'days': (end - first).days + 1, 'students': students,
+                        'rows': len(report), 'cold_s': cold_s, 'warm_s': warm_s})
+    return results
+
+
+def metadata(args):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'time': datetime.now().isoformat(timespec='seconds'), 'commit': commit,
+            'python': platform.python_version(), 'numpy': np.__version__, 'opencv': cv2.__version__,
+            'platform': platform.platform(), 'cpus': os.cpu_count(), 'args': vars(args)}
+
+
+# Flatten results to {'section[label].metric': seconds-or-ms} for comparison
+def timings(results):
+    flat = {}
+    for section in SECTIONS:
+        for entry in results.get(section, []):
+            for key, value in entry.items():
+                if isinstance(value, dict):
+                    for sub, v in value.items():
+                        flat[f"{section}[{entry['label']}].{key}.{sub}"] = v
+                elif key.endswith(('_s', '_ms', '_us')):
+                    flat[f"{section}[{entry['label']}].{key}"] = value
+    return flat
+
+
+def compare(baseline, results):
+    old, new = timings(baseline), timings(results)
+    for key in sorted(old.keys() & new.keys()):
+        if old[key] > 0:
+            print(f"{key}: {old[key]:.6g} -> {new[key]:.6g} (x{new[key] / old[key]:.2f})", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--only', nargs='+', choices=SECTIONS, default=list(SECTIONS))
+    parser.add_argument('--quick', action='store_true', help='small sizes, for a fast smoke run')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--gallery-sizes', type=int, nargs='+', default=[5, 25, 100],
+                        help='images per findEncodings run')
+    parser.add_argument('--faces', type=int, nargs='+', default=[1, 2, 5, 10, 20], help='faces per frame')
+    parser.add_argument('--match-sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--match-batches', type=int, nargs='+', default=[1, 20])
+    parser.add_argument('--indexes', nargs='+', default=['exact', 'ivf'])
+    parser.add_argument('--marks', type=int, default=1000)
+    parser.add_argument('--report-years', type=int, default=2)
+    parser.add_argument('--report-students', type=int, default=500)
+    parser.add_argument('--output', help='write the JSON here instead of stdout')
+    parser.add_argument('--compare', help='earlier JSON output to compare timings against')
+    args = parser.parse_args()
+    if args.quick:
+        args.repeat = 2
+        args.gallery_sizes = [5, 10]
+        args.faces = [1, 5]
+        args.match_sizes = [1000, 10000]
+        args.marks = 200
+        args.report_years = 1
+        args.report_students = 100
+
+    photos = load_photos()
+    results = {'meta': metadata(args)}
+    cwd = os.getcwd()
+    # Progress messages from the app go to stderr, stdout is for the JSON
+    with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(sys.stderr):
+        # imagerec sets up its gallery, cache and attendance files in the
+        # working directory when imported
+        os.chdir(directory)
+        try:
+            import imagerec
+            if 'encodings' in args.only:
+                results['encodings'] = bench_encodings(imagerec, photos, args.gallery_sizes, args.repeat)
+            if 'frame' in args.only:
+                results['frame'] = bench_frame(photos, args.faces, 1000, args.repeat)
+            if 'match' in args.only:
+                results['match'] = bench_match(args.match_sizes, args.match_batches, args.indexes, args.repeat)
+            if 'mark' in args.only:
+                results['mark'] = bench_mark(imagerec, args.marks)
+            if 'report' in args.only:
+                results['report'] = bench_report(imagerec, args.report_years, args.report_students, args.repeat)
+        finally:
+            os.chdir(cwd)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
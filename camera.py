@@ -0,0 +1,162 @@
+import threading
+import time
+
+from sources import open_source
+
+
+class CaptureBroker:
+    """Owns one capture device and shares its frames with every consumer.
+
+    A single reader thread pulls frames from the device and keeps only the
+    latest one, numbered with a sequence counter. Any number of consumers
+    (the recognition pipeline, the registration preview, snapshot requests)
+    read that frame without touching the device. The device is opened when
+    the first consumer subscribes and released once none is left for
+    ``idle_release`` seconds. Frames are shared, so consumers must copy a
+    frame before drawing on it. A source that reports ``ended`` (a replay
+    that does not loop) is not reopened; readers then see ``ended`` too.
+    """
+
+    def __init__(self, source, open_capture=None, idle_release=5.0):
+        self.source = source
+        self.open_capture = open_capture if open_capture is not None else open_source
+        self.idle_release = idle_release
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._frame = None
+        self._captured_at = None
+        self._consumers = 0
+        self._thread = None
+        self._opened = threading.Event()
+        self._failed = False
+        self.ended = False
+        self.listeners = []
+
+    def subscribe(self):
+        with self._cond:
+            self._consumers += 1
+            if self._thread is None and not self.ended:
+                self._opened.clear()
+                self._failed = False
+                self._thread = threading.Thread(target=self._run, name=f'capture-{self.source}', daemon=True)
+                self._thread.start()
+        return BrokerReader(self)
+
+    def unsubscribe(self):
+        with self._cond:
+            self._consumers -= 1
+
+    def latest(self):
+        """Return (seq, frame, captured_at) for the newest frame; frame is None before the first."""
+        with self._cond:
+            return self._seq, self._frame, self._captured_at
+
+    @property
+    def failed(self):
+        """True once the source could not be opened or has ended."""
+        return self._opened.is_set() and self._failed
+
+    def wait_opened(self, timeout=5.0):
+        self._opened.wait(timeout)
+        return self._opened.is_set() and not self._failed
+
+    def wait_frame(self, after_seq, timeout=2.0):
+        """Block until a frame newer than ``after_seq`` arrives; None on timeout or failure."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > after_seq or self._failed, timeout)
+            if self._seq > after_seq:
+                return self._seq, self._frame, self._captured_at
+            return None
+
+    def _run(self):
+        cap = self.open_capture(self.source)
+        if not cap.isOpened():
+            print(f"Error: Could not open camera {self.source}")
+            with self._cond:
+                self._failed = True
+                self._thread = None
+                self._cond.notify_all()
+            self._opened.set()
+            return
+        self._opened.set()
+
+        idle_since = None
+        while True:
+            with self._cond:
+                if self._consumers > 0:
+                    idle_since = None
+                elif idle_since is None:
+                    idle_since = time.monotonic()
+                elif time.monotonic() - idle_since > self.idle_release:
+                    # Nobody is watching any more; give the device back
+                    self._thread = None
+                    self._frame = None
+                    break
+
+            success, img = cap.read()
+            if not success and getattr(cap, 'ended', False):
+                print(f"Camera {self.source} reached the end of its frames")
+                with self._cond:
+                    # The last frame stays readable for latest() and late readers
+                    self.ended = self._failed = True
+                    self._thread = None
+                    self._cond.notify_all()
+                break
+            if not success:
+                print(f"Failed to get frame from camera {self.source}")
+                time.sleep(1)  # Wait before retrying
+                cap.release()
+                cap = self.open_capture(self.source)  # Try to reconnect
+                continue
+
+            with self._cond:
+                self._seq += 1
+                self._frame = img
+                self._captured_at = time.monotonic()
+                self._cond.notify_all()
+            for listener in self.listeners:
+                listener()
+        cap.release()
+
+
+class BrokerReader:
+    """A ``cv2.VideoCapture``-like handle on a broker; each ``read`` returns a new frame."""
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.seq = 0
+        # time.monotonic() when the device delivered the last frame read
+        self.captured_at = None
+        self._released = False
+
+    @property
+    def ended(self):
+        return self.broker.ended
+
+    def isOpened(self):
+        return self.broker.wait_opened()
+
+    def read(self, timeout=2.0):
+        result = self.broker.wait_frame(self.seq, timeout)
+        if result is None:
+            return False, None
+        self.seq, frame, self.captured_at = result
+        return True, frame
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.broker.unsubscribe()
+
+
+_brokers = {}
+_brokers_lock = threading.Lock()
+
+
+# The broker for a source, created on first use so each device is opened once
+def get_broker(source):
+    with _brokers_lock:
+        broker = _brokers.get(source)
+        if broker is None:
+            broker = _brokers[source] = CaptureBroker(source)
+        return broker
@@ -0,0 +1,90 @@
+import collections
+import json
+import threading
+
+KEEPALIVE = ': keepalive\n\n'
+
+class EventHub:
+    """In-process publish/subscribe for the dashboard's Server-Sent Events.
+
+    Every published event gets an increasing id and goes into a short ring
+    buffer. Subscribers block on a condition variable and are handed whatever
+    was published after the last id they saw, so the cost of an open tab is
+    one sleeping thread until something actually happens. A browser that
+    reconnects sends ``Last-Event-ID`` and resumes from the buffer; if it
+    fell further behind than ``history`` events it gets a ``resync`` event and
+    reloads its panels once.
+    """
+
+    def __init__(self, history=256, keepalive=15.0):
+        self.keepalive = keepalive
+        self.subscribers = 0
+        self.listeners = []
+        self._events = collections.deque(maxlen=history)
+        self._last_id = 0
+        self._cond = threading.Condition()
+
+    def publish(self, kind, data):
+        with self._cond:
+            self._last_id += 1
+            self._events.append((self._last_id, kind, json.dumps(data)))
+            self._cond.notify_all()
+        for listener in self.listeners:
+            listener()
+
+    def events_after(self, last_id, timeout=None):
+        """Events newer than ``last_id``, waiting up to ``timeout`` for the first one.
+
+        Returns None when ``last_id`` is older than the buffer reaches back.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._last_id > last_id, timeout)
+            if not self._events or self._last_id <= last_id:
+                return []
+            if self._events[0][0] > last_id + 1:
+                return None
+            return [event for event in self._events if event[0] > last_id]
+
+    def join(self, last_id=None):
+        """Register a client; returns (last_id, text to send first)."""
+        with self._cond:
+            self.subscribers += 1
+            if last_id is None:
+                last_id = self._last_id
+            # Tell the browser how soon to reconnect after a drop
+            prelude = 'retry: 3000\n\n'
+            # An id from before a server restart; start over from here
+            if last_id > self._last_id:
+                last_id = self._last_id
+                prelude += f'id: {last_id}\nevent: resync\ndata: {{}}\n\n'
+        return last_id, prelude
+
+    def leave(self):
+        with self._cond:
+            self.subscribers -= 1
+
+    def next_chunk(self, last_id, timeout=None):
+        """Returns (last_id, SSE text for the events after ``last_id``), text None if there were none."""
+        events = self.events_after(last_id, timeout)
+        if events is None:
+            with self._cond:
+                last_id = self._last_id
+            return last_id, f'id: {last_id}\nevent: resync\ndata: {{}}\n\n'
+        if not events:
+            return last_id, None
+        return events[-1][0], ''.join(f'id: {event_id}\nevent: {kind}\ndata: {data}\n\n'
+                                      for event_id, kind, data in events)
+
+    def stream(self, last_id=None):
+        """Generator of SSE text for one client."""
+        last_id, prelude = self.join(last_id)
+        try:
+            yield prelude
+            while True:
+                last_id, text = self.next_chunk(last_id, self.keepalive)
+                # A comment line when nothing happened; keeps proxies from
+                # closing the connection and lets the server notice clients
+                # that went away
+                yield text if text is not None else KEEPALIVE
+        finally:
+            self.leave()
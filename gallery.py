@@ -0,0 +1,553 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+import face_recognition
+
+# Folder with the registered student photos and the default cache location
+IMAGES_PATH = 'ImagesAttendance'
+CACHE_PATH = 'encodings_cache'
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+CACHE_VERSION = 1
+
+# Below this many photos a process pool costs more than it saves
+MIN_PARALLEL_IMAGES = 8
+
+
+# Encode a single BGR image, returning None when no face is found
+def encode_image(img):
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    encodings = face_recognition.face_encodings(img)
+    if not encodings:
+        return None
+    return encodings[0]
+
+
+def encode_file(filepath):
+    img = cv2.imread(filepath)
+    if img is None:
+        print(f"Could not read image: {os.path.basename(filepath)}")
+        return None
+    return encode_image(img)
+
+
+# Run fn over items, optionally spread over a process pool. Results keep the
+# input order so every encoding stays tied to its photo.
+def parallel_map(fn, items, workers=None, label='Encoding'):
+    items = list(items)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(items))
+
+    if workers <= 1 or len(items) < MIN_PARALLEL_IMAGES:
+        return [fn(item) for item in items]
+
+    # A few chunks per worker keeps them busy without paying per-item IPC
+    chunksize = max(1, len(items) // (workers * 4))
+    results = []
+    start = time.time()
+    step = max(1, len(items) // 10)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for result in executor.map(fn, items, chunksize=chunksize):
+            results.append(result)
+            if len(results) % step == 0 or len(results) == len(items):
+                print(f"{label}: {len(results)}/{len(items)} ({time.time() - start:.1f}s, {workers} workers)")
+    return results
+
+
+def encode_images(images, workers=None):
+    return parallel_map(encode_image, images, workers)
+
+
+def encode_files(filepaths, workers=None):
+    return parallel_map(encode_file, filepaths, workers)
+
+
+# Hash the file contents so a touched but unchanged photo is not re-encoded
+def file_digest(filepath):
+    digest = hashlib.sha1()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def list_gallery_images(path=IMAGES_PATH):
+    if not os.path.exists(path):
+        return []
+    return [f for f in os.listdir(path) if f.lower().endswith(IMAGE_EXTENSIONS)]
+
+
+class EncodingCache:
+    """Persistent face encodings for the photos in the gallery folder.
+
+    Encodings are stored as one float64 matrix in ``<cache_path>.npy`` and the
+    per-file metadata (name, size, mtime, content hash, matrix row) in
+    ``<cache_path>.json``. Photos without a detectable face are remembered too
+    so they are not re-encoded on every start.
+    """
+
+    def __init__(self, image_path=IMAGES_PATH, cache_path=CACHE_PATH):
+        self.image_path = image_path
+        self.matrix_file = cache_path + '.npy'
+        self.index_file = cache_path + '.json'
+        self.entries = {}
+
+    def load(self):
+        self.entries = {}
+        if not (os.path.isfile(self.matrix_file) and os.path.isfile(self.index_file)):
+            return self.entries
+
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            matrix = np.load(self.matrix_file, allow_pickle=False)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable encoding cache: {e}")
+            return self.entries
+
+        if index.get('version') != CACHE_VERSION:
+            print("Encoding cache version changed, rebuilding")
+            return self.entries
+
+        for entry in index.get('files', []):
+            row = entry.pop('row')
+            entry['encoding'] = matrix[row] if row is not None else None
+            self.entries[entry['file']] = entry
+        return self.entries
+
+    def save(self):
+        files = []
+        rows = []
+        for entry in self.entries.values():
+            record = {k: v for k, v in entry.items() if k != 'encoding'}
+            if entry['encoding'] is None:
+                record['row'] = None
+            else:
+                record['row'] = len(rows)
+                rows.append(entry['encoding'])
+            files.append(record)
+
+        matrix = np.array(rows, dtype=np.float64).reshape(len(rows), 128)
+
+        # Write to temporary files first so a crash never leaves a torn cache
+        with open(self.matrix_file + '.tmp', 'wb') as f:
+            np.save(f, matrix)
+        with open(self.index_file + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'version': CACHE_VERSION, 'files': files}, f)
+        os.replace(self.matrix_file + '.tmp', self.matrix_file)
+        os.replace(self.index_file + '.tmp', self.index_file)
+
+    def _stat(self, filename):
+        st = os.stat(os.path.join(self.image_path, filename))
+        return st.st_size, st.st_mtime_ns
+
+    def sync(self, workers=None):
+        """Bring the cache in line with the gallery folder.
+
+        Only new or changed photos are encoded, over ``workers`` processes;
+        photos that disappeared are dropped. Returns the class names and
+        encodings in folder order.
+        """
+        current = list_gallery_images(self.image_path)
+        changed = False
+
+        # Drop photos that were removed from the folder
+        present = set(current)
+        for filename in list(self.entries):
+            if filename not in present:
+                del self.entries[filename]
+                changed = True
+
+        stale = []
+        for filename in current:
+            filepath = os.path.join(self.image_path, filename)
+            size, mtime_ns = self._stat(filename)
+            entry = self.entries.get(filename)
+            if entry and entry['size'] == size and entry['mtime_ns'] == mtime_ns:
+                continue
+
+            digest = file_digest(filepath)
+            if entry and entry['sha1'] == digest:
+                # Same contents, only the timestamp moved
+                entry['size'], entry['mtime_ns'] = size, mtime_ns
+                changed = True
+                continue
+
+            stale.append((filename, size, mtime_ns, digest))
+
+        if stale:
+            print(f'Encoding {len(stale)} new or changed images...')
+            filepaths = [os.path.join(self.image_path, item[0]) for item in stale]
+            for (filename, size, mtime_ns, digest), encoding in zip(stale, encode_files(filepaths, workers)):
+                if encoding is None:
+                    print(f"No face found in {filename}. Skipping...")
+                self.entries[filename] = {
+                    'file': filename,
+                    'name': os.path.splitext(filename)[0],
+                    'size': size,
+                    'mtime_ns': mtime_ns,
+                    'sha1': digest,
+                    'encoding': encoding,
+                }
+            changed = True
+
+        if changed:
+            self.save()
+
+        names = []
+        encodings = []
+        for filename in current:
+            entry = self.entries.get(filename)
+            if entry is not None and entry['encoding'] is not None:
+                names.append(entry['name'])
+                encodings.append(entry['encoding'])
+        return names, encodings
+
+    def verify(self, reencode=False, tolerance=1e-6):
+        """Check every cached entry against the folder and return the problems found."""
+        problems = []
+        current = set(list_gallery_images(self.image_path))
+
+        for filename in sorted(current - set(self.entries)):
+            problems.append(f"{filename}: not in cache")
+        for filename, entry in sorted(self.entries.items()):
+            if filename not in current:
+                problems.append(f"{filename}: cached but missing from {self.image_path}")
+                continue
+
+            if file_digest(os.path.join(self.image_path, filename)) != entry['sha1']:
+                problems.append(f"{filename}: contents changed since it was encoded")
+                continue
+
+            if reencode:
+                fresh = encode_file(os.path.join(self.image_path, filename))
+                if (fresh is None) != (entry['encoding'] is None):
+                    problems.append(f"{filename}: face detection result differs from cache")
+                elif fresh is not None and np.abs(fresh - entry['encoding']).max() > tolerance:
+                    problems.append(f"{filename}: encoding differs from cache")
+        return problems
+
+
+class GallerySnapshot:
+    """Immutable view of the gallery at one version.
+
+    The arrays are read-only slices of the gallery buffers, so taking a
+    snapshot copies nothing and it stays valid while newer versions are
+    published.
+    """
+
+    __slots__ = ('version', 'matrix', 'sq_norms', 'names', 'index', 'index_state')
+
+    def __init__(self, version, matrix, sq_norms, names, index, index_state):
+        for array in (matrix, sq_norms, names):
+            array.flags.writeable = False
+        self.version = version
+        self.matrix = matrix
+        self.sq_norms = sq_norms
+        self.names = names
+        self.index = index
+        self.index_state = index_state
+
+    def __len__(self):
+        return len(self.matrix)
+
+    def search(self, face_encodings):
+        """Return the best gallery index and its distance for each face."""
+        return self.index.search(self.index_state, self.matrix, self.sq_norms, face_encodings)
+
+
+class GalleryMatrix:
+    """Known encodings as one contiguous float32 matrix with a parallel name array.
+
+    Rows are preallocated and the capacity doubles when full, so registering a
+    student is an amortised O(1) row write. Readers never lock: they take
+    ``snapshot`` once and search it. Writers fill the rows past the end of the
+    current snapshot and then swap in a new one, which is a single atomic
+    attribute assignment.
+    """
+
+    def __init__(self, names=(), encodings=(), capacity=1024, index=None):
+        names = list(names)
+        capacity = max(capacity, len(names))
+        self.matrix = np.zeros((capacity, 128), dtype=np.float32)
+        self.sq_norms = np.zeros(capacity, dtype=np.float32)
+        self.names = np.empty(capacity, dtype=object)
+        self.size = len(names)
+        if names:
+            self.matrix[:self.size] = np.asarray(encodings, dtype=np.float32)
+            self.sq_norms[:self.size] = np.einsum('ij,ij->i', self.matrix[:self.size], self.matrix[:self.size])
+            self.names[:self.size] = names
+        self.index = index if index is not None else ExactIndex()
+        self._write_lock = threading.Lock()
+        self.snapshot = self._publish(0, self.index.rebuild(self.matrix[:self.size]))
+
+    def __len__(self):
+        return len(self.snapshot)
+
+    def _publish(self, version, index_state):
+        n = self.size
+        return GallerySnapshot(version, self.matrix[:n], self.sq_norms[:n], self.names[:n],
+                               self.index, index_state)
+
+    def _grow(self):
+        # Older snapshots keep referencing the previous buffers
+        capacity = len(self.matrix) * 2
+        matrix = np.zeros((capacity, 128), dtype=np.float32)
+        sq_norms = np.zeros(capacity, dtype=np.float32)
+        names = np.empty(capacity, dtype=object)
+        matrix[:self.size] = self.matrix[:self.size]
+        sq_norms[:self.size] = self.sq_norms[:self.size]
+        names[:self.size] = self.names[:self.size]
+        self.matrix, self.sq_norms, self.names = matrix, sq_norms, names
+
+    def add(self, name, encoding):
+        with self._write_lock:
+            if self.size == len(self.matrix):
+                self._grow()
+            row = np.asarray(encoding, dtype=np.float32)
+            self.matrix[self.size] = row
+            self.sq_norms[self.size] = row @ row
+            self.names[self.size] = name
+            self.size += 1
+
+            current = self.snapshot
+            index_state = self.index.add(current.index_state, self.size - 1, self.matrix[:self.size])
+            self.snapshot = self._publish(current.version + 1, index_state)
+
+    def match(self, face_encodings):
+        return self.snapshot.search(face_encodings)
+
+
+# Nearest gallery row for every query face, from one (faces x gallery)
+# distance computation: |q - g|^2 = |q|^2 - 2 q.g + |g|^2
+def match_encodings(matrix, sq_norms, face_encodings):
+    queries = np.asarray(face_encodings, dtype=np.float32).reshape(-1, 128)
+    if len(queries) == 0 or len(matrix) == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float64)
+
+    sq_dists = sq_norms[np.newaxis, :] - 2.0 * (queries @ matrix.T)
+    best = np.argmin(sq_dists, axis=1)
+    return best, exact_distances(matrix, best, face_encodings)
+
+
+# The expanded form loses precision to cancellation, so the winning distances
+# are recomputed directly before they are compared to the tolerance
+def exact_distances(matrix, best, face_encodings):
+    queries = np.asarray(face_encodings, dtype=np.float64).reshape(-1, 128)
+    return np.linalg.norm(queries - matrix[best].astype(np.float64), axis=1)
+
+
+# Index of the nearest centroid for every row, in blocks to bound memory
+def nearest_centroids(data, centroids, block=16384):
+    c_norms = np.einsum('ij,ij->i', centroids, centroids)
+    assign = np.empty(len(data), dtype=np.intp)
+    for start in range(0, len(data), block):
+        chunk = data[start:start + block]
+        assign[start:start + block] = np.argmin(c_norms[np.newaxis, :] - 2.0 * (chunk @ centroids.T), axis=1)
+    return assign
+
+
+def kmeans(data, k, iterations=15, sample_per_list=256, seed=0):
+    rng = np.random.default_rng(seed)
+    if len(data) > k * sample_per_list:
+        data = data[rng.choice(len(data), k * sample_per_list, replace=False)]
+    centroids = data[rng.choice(len(data), k, replace=False)].astype(np.float32)
+
+    for _ in range(iterations):
+        assign = nearest_centroids(data, centroids)
+        counts = np.bincount(assign, minlength=k)
+        order = np.argsort(assign, kind='stable')
+        nonempty = counts > 0
+        starts = (np.cumsum(counts) - counts)[nonempty]
+        centroids[nonempty] = np.add.reduceat(data[order], starts, axis=0) / counts[nonempty, np.newaxis]
+        # Reseed lists that lost all their points
+        if not nonempty.all():
+            centroids[~nonempty] = data[rng.choice(len(data), int((~nonempty).sum()))]
+    return centroids
+
+
+# Index backends hold only their settings. The search structure they build is
+# returned as a state value that is stored in each gallery snapshot and never
+# modified afterwards; add() returns a new state instead.
+class ExactIndex:
+    """Brute-force search over every gallery row."""
+
+    def rebuild(self, matrix):
+        return None
+
+    def add(self, state, row, matrix):
+        return None
+
+    def search(self, state, matrix, sq_norms, face_encodings):
+        return match_encodings(matrix, sq_norms, face_encodings)
+
+
+class IVFIndex:
+    """Approximate search with an inverted file over k-means cells.
+
+    Each query is compared only with the rows in its ``n_probe`` nearest cells;
+    raising ``n_probe`` trades latency for recall and ``n_probe == n_lists``
+    is exact. Galleries smaller than ``min_train_size`` are searched exactly.
+    New rows join their nearest cell, and the cells are retrained once the
+    gallery has doubled since the last training.
+    """
+
+    def __init__(self, n_lists=None, n_probe=8, min_train_size=4096, iterations=15, seed=0):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.min_train_size = min_train_size
+        self.iterations = iterations
+        self.seed = seed
+
+    # State is (centroids, lists, trained_size), or None while the gallery is
+    # too small to be worth clustering
+    def rebuild(self, matrix):
+        if len(matrix) == 0 or len(matrix) < self.min_train_size:
+            return None
+
+        # k-means needs a distinct row to seed every cell
+        n_lists = min(self.n_lists or max(1, int(np.sqrt(len(matrix)))), len(matrix))
+        centroids = kmeans(matrix, n_lists, self.iterations, seed=self.seed)
+        assign = nearest_centroids(matrix, centroids)
+        order = np.argsort(assign, kind='stable')
+        lists = np.split(order, np.cumsum(np.bincount(assign, minlength=n_lists))[:-1])
+        return centroids, tuple(lists), len(matrix)
+
+    def add(self, state, row, matrix):
+        if state is None or len(matrix) >= 2 * state[2]:
+            return self.rebuild(matrix)
+
+        # Copy on write: only the list that gains the row is replaced
+        centroids, lists, trained_size = state
+        cell = nearest_centroids(matrix[row:row + 1], centroids)[0]
+        lists = list(lists)
+        lists[cell] = np.append(lists[cell], row)
+        return centroids, tuple(lists), trained_size
+
+    def search(self, state, matrix, sq_norms, face_encodings):
+        if state is None:
+            return match_encodings(matrix, sq_norms, face_encodings)
+
+        centroids, lists, _ = state
+        queries = np.asarray(face_encodings, dtype=np.float32).reshape(-1, 128)
+        if len(queries) == 0 or len(matrix) == 0:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float64)
+
+        n_probe = min(self.n_probe, len(centroids))
+        c_dists = np.einsum('ij,ij->i', centroids, centroids)[np.newaxis, :] - 2.0 * (queries @ centroids.T)
+        probes = np.argpartition(c_dists, n_probe - 1, axis=1)[:, :n_probe]
+
+        best = np.empty(len(queries), dtype=np.intp)
+        for i, query in enumerate(queries):
+            candidates = np.concatenate([lists[cell] for cell in probes[i]])
+            if len(candidates) == 0:
+                best[i] = match_encodings(matrix, sq_norms, query)[0][0]
+                continue
+            sq_dists = sq_norms[candidates] - 2.0 * (matrix[candidates] @ query)
+            best[i] = candidates[np.argmin(sq_dists)]
+        return best, exact_distances(matrix, best, face_encodings)
+
+
+INDEX_BACKENDS = {
+    'exact': ExactIndex,
+    'ivf': IVFIndex,
+}
+
+
+def make_index(backend='exact', **options):
+    if backend not in INDEX_BACKENDS:
+        raise ValueError(f"Unknown gallery index '{backend}', expected one of {sorted(INDEX_BACKENDS)}")
+    return INDEX_BACKENDS[backend](**options)
+
+
+def measure_recall(gallery, queries):
+    """Fraction of queries where the gallery's index finds the exact nearest row, and its mean latency."""
+    snapshot = gallery.snapshot
+    expected, _ = match_encodings(snapshot.matrix, snapshot.sq_norms, queries)
+
+    start = time.perf_counter()
+    found = np.array([snapshot.search(query)[0][0] for query in queries])
+    latency = (time.perf_counter() - start) / max(1, len(queries))
+    return float(np.mean(found == expected)), latency
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage the face encoding cache')
+    parser.add_argument('command', choices=['rebuild', 'update', 'verify', 'recall'])
+    parser.add_argument('--images', default=IMAGES_PATH, help='gallery folder')
+    parser.add_argument('--cache', default=CACHE_PATH, help='cache path without extension')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='encoding processes (default: all cores, 1 for serial)')
+    parser.add_argument('--reencode', action='store_true',
+                        help='with verify, also re-encode every photo and compare')
+    parser.add_argument('--synthetic', type=int, default=0,
+                        help='with recall, use this many random encodings instead of the cache')
+    parser.add_argument('--queries', type=int, default=200, help='with recall, number of queries')
+    parser.add_argument('--lists', type=int, default=None, help='with recall, IVF cells (default: sqrt(N))')
+    parser.add_argument('--probes', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32],
+                        help='with recall, n_probe values to compare against exact search')
+    args = parser.parse_args()
+
+    if args.command == 'recall':
+        return check_recall(args)
+
+    cache = EncodingCache(args.images, args.cache)
+
+    if args.command == 'verify':
+        cache.load()
+        problems = cache.verify(reencode=args.reencode)
+        for problem in problems:
+            print(problem)
+        print(f"{len(cache.entries)} cached entries, {len(problems)} problems")
+        return 1 if problems else 0
+
+    if args.command == 'update':
+        cache.load()
+    names, _ = cache.sync(workers=args.workers)
+    print(f"Cache holds {len(names)} encodings")
+    return 0
+
+
+# Compare IVF search at several n_probe settings against exact search. Queries
+# are gallery rows plus noise, roughly the distance of a new photo of the same
+# person.
+def check_recall(args):
+    rng = np.random.default_rng(0)
+    if args.synthetic:
+        encodings = rng.normal(scale=0.05, size=(args.synthetic, 128)).astype(np.float32)
+    else:
+        cache = EncodingCache(args.images, args.cache)
+        cache.load()
+        encodings = np.array([e['encoding'] for e in cache.entries.values() if e['encoding'] is not None])
+    if len(encodings) == 0:
+        print("No encodings to check")
+        return 1
+
+    names = [str(i) for i in range(len(encodings))]
+    rows = rng.choice(len(encodings), args.queries)
+    queries = encodings[rows] + rng.normal(scale=0.03, size=(args.queries, 128))
+
+    exact = GalleryMatrix(names, encodings)
+    _, latency = measure_recall(exact, queries)
+    print(f"exact: {len(encodings)} rows, {latency * 1000:.3f} ms/query")
+
+    index = IVFIndex(n_lists=args.lists, min_train_size=1)
+    approx = GalleryMatrix(names, encodings, index=index)
+    # n_probe is read at search time, so one trained index serves every setting
+    for n_probe in args.probes:
+        index.n_probe = n_probe
+        recall, latency = measure_recall(approx, queries)
+        print(f"ivf n_probe={n_probe}: recall@1 {recall:.3f}, {latency * 1000:.3f} ms/query")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
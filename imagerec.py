@@ -1,67 +1,143 @@
 import cv2
-import numpy as np
 import face_recognition
 import os
 from datetime import datetime, timedelta
-import pandas as pd
 import threading
-from flask import Flask, render_template, Response, request, jsonify, send_from_directory
+from flask import Flask, render_template, Response, request, jsonify, send_from_directory, g
 import base64
 import time
 import json
+import multiprocessing
+from attendance import AttendanceLedger, AttendanceSummaryCache, AttendanceWriter, make_store
+from camera import get_broker
+from eventstream import EventHub
+from gallery import EncodingCache, GalleryMatrix, encode_images, list_gallery_images, make_index
+from metrics import REGISTRY, REQUEST_SECONDS
+from pipeline import RecognitionPipeline
+from profiling import ProfileCapture
+from scheduling import DetectionScheduler
+from streaming import FrameBroadcaster, placeholder_part
+from tracking import FaceTracker
 
 app = Flask(__name__, static_folder='static')
 
+# Processes used to encode the gallery (None = all cores, 1 = serial)
+ENCODING_WORKERS = None
+
+# Maximum face distance counted as a match (face_recognition's default)
+MATCH_TOLERANCE = 0.6
+
+# Gallery search backend: 'exact' scans every encoding, 'ivf' is approximate
+# and meant for very large rosters (options: n_lists, n_probe, min_train_size)
+GALLERY_INDEX = 'exact'
+GALLERY_INDEX_OPTIONS = {}
+
+# Attendance storage: 'csv' keeps one Attendance_<date>.csv per day, 'sqlite'
+# uses an indexed database (options: path, export_csv)
+ATTENDANCE_BACKEND = 'csv'
+ATTENDANCE_OPTIONS = {}
+
+# Workers per detect/encode stage of the recognition pipeline, and whether
+# they are threads or processes ('thread' or 'process')
+PIPELINE_WORKERS = 2
+PIPELINE_POOL = 'thread'
+
+# Cameras to run recognition on. Each has its own pipeline and its own
+# /video_feed/<id> stream; 'source' is anything cv2.VideoCapture accepts
+# (device index, video file or stream URL) or a sources.py spec such as
+# 'video:lecture.mp4?fps=25' or 'synthetic:?fps=15&faces=3' for replaying
+# frames at a fixed rate. The first one backs /video_feed.
+CAMERAS = [
+    {'id': 'main', 'source': 0},
+]
+
+# Print each frame's trace id and age on the live stream
+LATENCY_OVERLAY = False
+
+# Camera used for the registration preview and photo capture
+REGISTRATION_SOURCE = CAMERAS[0]['source']
+
+# Seconds between pictures on an idle registration preview (Flask server)
+REGISTRATION_IDLE_RESEND = 2.0
+
+# Token required by the /admin endpoints (X-Admin-Token header). When None
+# they only answer requests from this machine.
+ADMIN_TOKEN = None
+
 # Function to find encodings for known faces
-def findEncodings(images):
+def findEncodings(images, workers=1):
     encodeList = []
-    for img in images:
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        try:
-            encode = face_recognition.face_encodings(img)[0]
+    for encode in encode_images(images, workers):
+        if encode is not None:
             encodeList.append(encode)
-        except IndexError:
+        else:
             print(f"No face found in one of the images. Skipping...")
     return encodeList
 
 # Function to mark attendance in CSV file
 def markAttendance(name):
     now = datetime.now()
-    dateString = now.strftime('%Y-%m-%d')
-    timeString = now.strftime('%H:%M:%S')
-    
-    # Create attendance file if it doesn't exist
-    filename = f'Attendance_{dateString}.csv'
-    if not os.path.isfile(filename):
-        df = pd.DataFrame(columns=['Name', 'Time', 'Date'])
-        df.to_csv(filename, index=False)
-    
-    # Read existing attendance
-    df = pd.read_csv(filename)
-    
-    # Check if person is already marked for today
-    if not df['Name'].str.contains(name).any():
-        new_row = {'Name': name, 'Time': timeString, 'Date': dateString}
-        df = df._append(new_row, ignore_index=True)
-        df.to_csv(filename, index=False)
-        return f"{name} - Marked"
-    else:
-        return f"{name} - Already Marked"
+    attendance_status = attendance_ledger.mark(name, now)
+    attendance_marks.labels(attendance_status.rsplit(' - ', 1)[-1]).inc()
+    if attendance_status.endswith(' - Marked'):
+        # Push the new row and the new head count to open dashboards
+        event_hub.publish('attendance', {
+            'name': name,
+            'time': now.strftime('%H:%M:%S'),
+            'date': now.strftime('%Y-%m-%d'),
+            'status': 'Present'
+        })
+        event_hub.publish('stats', current_stats())
+    return attendance_status
 
 # Global variables for thread-safe operation
 frame_lock = threading.Lock()
-current_frame = None
-registration_frame = None
+frame_broadcasters = {}  # camera id -> FrameBroadcaster of annotated frames
 recognition_events = []
-classNames = []
-encodeListKnown = []
+recognition_pipelines = {}  # camera id -> RecognitionPipeline
+event_hub = EventHub()  # server-sent events for the dashboard
+profile_capture = ProfileCapture()  # on-demand stack sampling, see /admin/profile
+attendance_store = make_store(ATTENDANCE_BACKEND, **ATTENDANCE_OPTIONS)
+attendance_writer = AttendanceWriter(attendance_store, flush_interval=1.0, fsync='batch')
+attendance_ledger = AttendanceLedger(attendance_store, writer=attendance_writer)
+attendance_summaries = AttendanceSummaryCache(attendance_store)
+known_gallery = GalleryMatrix()
 camera_running = False
 registration_camera_running = False
 
+# Counters and gauges for /metrics. Timings are recorded where they happen
+# (pipeline stages, stream encodes, requests); everything else is read from
+# the app's own state when scraped.
+attendance_marks = REGISTRY.counter('attendance_marks_total', 'markAttendance calls by outcome', ('outcome',))
+
+def pipeline_samples(field, stages=RecognitionPipeline.STAGES):
+    for camera_id, pipeline in list(recognition_pipelines.items()):
+        stats = pipeline.snapshot_stats()
+        for stage in stages:
+            if field in stats[stage]:
+                yield (camera_id, stage), stats[stage][field]
+
+REGISTRY.callback('attendance_pipeline_processed_total', 'Items each pipeline stage finished', 'counter',
+                  ('camera', 'stage'), lambda: pipeline_samples('processed'))
+REGISTRY.callback('attendance_pipeline_dropped_total', 'Frames or jobs dropped by each pipeline stage', 'counter',
+                  ('camera', 'stage'), lambda: pipeline_samples('dropped'))
+REGISTRY.callback('attendance_pipeline_errors_total', 'Failed detection or encoding passes', 'counter',
+                  ('camera', 'stage'), lambda: pipeline_samples('errors'))
+REGISTRY.callback('attendance_pipeline_queued', 'Items waiting in each pipeline queue', 'gauge',
+                  ('camera', 'stage'), lambda: pipeline_samples('queued', ('detect', 'encode')))
+REGISTRY.callback('attendance_camera_fps', 'Smoothed capture rate per camera', 'gauge', ('camera',),
+                  lambda: [((camera_id,), round(p.fps, 2)) for camera_id, p in list(recognition_pipelines.items())])
+REGISTRY.callback('attendance_gallery_size', 'Registered face encodings', 'gauge', (),
+                  lambda: [((), len(known_gallery))])
+REGISTRY.callback('attendance_stream_viewers', 'Open video_feed streams per camera', 'gauge', ('camera',),
+                  lambda: [((camera_id,), b.viewers) for camera_id, b in list(frame_broadcasters.items())])
+REGISTRY.callback('attendance_event_stream_clients', 'Open /api/stream connections', 'gauge', (),
+                  lambda: [((), event_hub.subscribers)])
+REGISTRY.callback('attendance_writer_queue', 'Attendance rows waiting to be written', 'gauge', (),
+                  lambda: [((), attendance_writer.queue.qsize())])
+
 # Load initial images and encodings
 def initialize_face_recognition():
-    global classNames, encodeListKnown
-    
     # Path to your images folder
     path = 'ImagesAttendance'
     
@@ -71,78 +147,90 @@ def initialize_face_recognition():
         print(f"Created directory: {path}")
         return [], []  # Return empty lists since there are no images yet
     
-    images = []
-    classNames = []
-    myList = os.listdir(path)
-    
-    if not myList:
+    if not list_gallery_images(path):
         print("No images found in the ImagesAttendance directory")
         return [], []
     
-    # Load all images and names
-    for cl in myList:
-        if cl.lower().endswith(('.png', '.jpg', '.jpeg')):
-            curImg = cv2.imread(f'{path}/{cl}')
-            if curImg is not None:
-                images.append(curImg)
-                classNames.append(os.path.splitext(cl)[0])  # Remove file extension
-            else:
-                print(f"Could not read image: {cl}")
-    
+    # Only new or changed photos are encoded, the rest come from the cache
     print('Encoding Images...')
-    encodeListKnown = findEncodings(images)
+    cache = EncodingCache(path)
+    cache.load()
+    classNames, encodeListKnown = cache.sync(workers=ENCODING_WORKERS)
     print('Encoding Complete')
     
     return classNames, encodeListKnown
 
-# Initialize face recognition
-classNames, encodeListKnown = initialize_face_recognition()
+# Initialize face recognition (spawned encoding workers re-import this module
+# and must not load the gallery themselves)
+if multiprocessing.parent_process() is None:
+    known_gallery = GalleryMatrix(*initialize_face_recognition(),
+                                  index=make_index(GALLERY_INDEX, **GALLERY_INDEX_OPTIONS))
 
-# Function to generate frames for streaming
-def generate_frames():
-    global current_frame, camera_running
-    
-    while True:
-        with frame_lock:
-            if current_frame is not None and camera_running:
-                ret, buffer = cv2.imencode('.jpg', current_frame)
-                frame = buffer.tobytes()
-                yield (b'--frame\r\n'
-                      b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-        time.sleep(0.03)  # Limit to roughly 30 FPS
+# The broadcaster for a camera, created on first use
+def get_broadcaster(camera_id):
+    with frame_lock:
+        broadcaster = frame_broadcasters.get(camera_id)
+        if broadcaster is None:
+            broadcaster = frame_broadcasters[camera_id] = FrameBroadcaster()
+        return broadcaster
+
+# Function to generate frames for streaming. Every viewer of a camera shares
+# one JPEG encode per frame (per width/quality variant) and only wakes up
+# when a new frame is published.
+def generate_frames(camera_id, width=None, quality=None):
+    return get_broadcaster(camera_id).stream(width, quality)
 
 # Function to generate frames for registration camera
 def generate_registration_frames():
-    global registration_frame, registration_camera_running
+    global registration_camera_running
     
-    cap = cv2.VideoCapture(0)
+    # Frames come from the shared capture broker, so the preview never opens
+    # the device a second time
+    cap = get_broker(REGISTRATION_SOURCE).subscribe()
     if not cap.isOpened():
         print("Error: Could not open webcam for registration")
+        cap.release()
         return
     
+    try:
+        yield from registration_stream(cap)
+    finally:
+        # Runs when the viewer disconnects too
+        cap.release()
+
+def registration_stream(cap):
+    last_part = None
+    last_sent = time.monotonic()
     while True:
         if registration_camera_running:
             success, img = cap.read()
             if not success:
                 break
-            
-            # Add a frame to indicate this is for capture
-            cv2.putText(img, "Click 'Capture' to take photo", (20, 50), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 120, 255), 2)
-            cv2.rectangle(img, (100, 100), (540, 380), (0, 255, 0), 2)  # Frame for face positioning
-            
-            ret, buffer = cv2.imencode('.jpg', img)
-            frame = buffer.tobytes()
-            
-            # Update the global frame
-            with frame_lock:
-                registration_frame = img
-            
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+            last_part = registration_part(img)
+            last_sent = time.monotonic()
+            yield last_part
         else:
             time.sleep(0.1)  # Sleep when camera is not active
+            # Re-send a picture every few seconds while idle: writing to a
+            # closed tab fails, which ends this stream and frees its thread
+            if time.monotonic() - last_sent >= REGISTRATION_IDLE_RESEND:
+                last_sent = time.monotonic()
+                yield last_part or placeholder_part("Registration camera is off")
+
+# One preview part: the overlay drawn on a copy of the camera frame
+def registration_part(img):
+    # The broker shares this frame with other consumers, so draw on a copy
+    img = img.copy()
+    
+    # Add a frame to indicate this is for capture
+    cv2.putText(img, "Click 'Capture' to take photo", (20, 50), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 120, 255), 2)
+    cv2.rectangle(img, (100, 100), (540, 380), (0, 255, 0), 2)  # Frame for face positioning
+    
+    ret, buffer = cv2.imencode('.jpg', img)
+    frame = buffer.tobytes()
     
-    cap.release()
+    return (b'--frame\r\n'
+            b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
 
 # Function to count students registered
 def count_students():
@@ -152,87 +240,41 @@ def count_students():
     
     return len([f for f in os.listdir(path) if f.lower().endswith(('.png', '.jpg', '.jpeg'))])
 
-# Function to count students present today
+# Function to count students present today (the ledger already holds
+# today's names, so the CSV is not re-read)
 def count_present_today():
+    return attendance_ledger.present_count()
+
+# Dashboard header numbers, served by /api/stats and pushed on changes
+def current_stats():
     now = datetime.now()
-    dateString = now.strftime('%Y-%m-%d')
-    filename = f'Attendance_{dateString}.csv'
-    
-    if not os.path.isfile(filename):
-        return 0
-    
-    df = pd.read_csv(filename)
-    return len(df)
+    return {
+        'totalStudents': count_students(),
+        'presentToday': count_present_today(),
+        'date': now.strftime('%Y-%m-%d'),
+        'time': now.strftime('%H:%M:%S')
+    }
 
 # Get attendance data for a specific date
 def get_attendance_for_date(date_str):
-    filename = f'Attendance_{date_str}.csv'
-    
-    if os.path.isfile(filename):
-        df = pd.read_csv(filename)
-        attendance_data = []
-        
-        for _, row in df.iterrows():
-            attendance_data.append({
-                'name': row['Name'],
-                'time': row['Time'],
-                'status': 'Present'
-            })
-            
-        return attendance_data
-    else:
-        return []
+    return attendance_store.records_for_date(date_str)
 
 # Get attendance summary report for a date range
 def get_attendance_report(start_date, end_date):
-    start = datetime.strptime(start_date, '%Y-%m-%d')
-    end = datetime.strptime(end_date, '%Y-%m-%d')
-    
-    # Dictionary to store each student's attendance
-    report = {}
-    
-    # Dictionary to keep track of all dates in the range
-    all_dates = {}
-    
-    # Generate all dates in the range
-    current_date = start
-    while current_date <= end:
-        date_str = current_date.strftime('%Y-%m-%d')
-        all_dates[date_str] = True
-        current_date += timedelta(days=1)
-    
-    # Process each date in the range
-    current_date = start
-    while current_date <= end:
-        date_str = current_date.strftime('%Y-%m-%d')
-        filename = f'Attendance_{date_str}.csv'
-        
-        if os.path.isfile(filename):
-            df = pd.read_csv(filename)
-            
-            for _, row in df.iterrows():
-                name = row['Name']
-                
-                if name not in report:
-                    report[name] = {
-                        'name': name,
-                        'totalPresent': 0,
-                        'totalDays': len(all_dates),
-                        'percentage': 0,
-                        'dates': {}
-                    }
-                
-                # Mark this date as present
-                report[name]['dates'][date_str] = 'Present'
-                report[name]['totalPresent'] += 1
-        
-        current_date += timedelta(days=1)
-    
-    # Calculate attendance percentage for each student
-    for student in report.values():
-        student['percentage'] = round((student['totalPresent'] / student['totalDays']) * 100, 1)
-    
-    return list(report.values())
+    return attendance_summaries.report(start_date, end_date)
+
+# Per-route request latency for /metrics
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    start = g.get('request_start')
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        REQUEST_SECONDS.labels(route, request.method, response.status_code).observe(time.perf_counter() - start)
+    return response
 
 # Routes for the web application
 @app.route('/')
@@ -244,8 +286,16 @@ def serve_static(path):
     return send_from_directory('static', path)
 
 @app.route('/video_feed')
-def video_feed():
-    return Response(generate_frames(),
+@app.route('/video_feed/<camera_id>')
+def video_feed(camera_id=None):
+    if camera_id is None:
+        camera_id = CAMERAS[0]['id']
+    elif camera_id not in {camera['id'] for camera in CAMERAS}:
+        return jsonify({'success': False, 'message': f'Unknown camera: {camera_id}'}), 404
+    # Optional ?width=&quality= select a smaller or lighter stream for tiles
+    width = request.args.get('width', type=int)
+    quality = request.args.get('quality', type=int)
+    return Response(generate_frames(camera_id, width, quality),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
 @app.route('/registration_feed')
@@ -253,23 +303,33 @@ def registration_feed():
     return Response(generate_registration_frames(),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
+# The last recognition events, optionally for one camera
+def recent_events(camera_id=None):
+    if camera_id:
+        return [event for event in recognition_events if event['camera'] == camera_id][-10:]
+    return recognition_events[-10:]
+
+# Report range with the dashboard's defaults (the last 7 days)
+def report_dates(start_date=None, end_date=None):
+    start_date = start_date or (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
+    end_date = end_date or datetime.now().strftime('%Y-%m-%d')
+    return start_date, end_date
+
 @app.route('/api/events')
 def get_events():
-    global recognition_events
-    return jsonify(recognition_events[-10:])
+    return jsonify(recent_events(request.args.get('camera')))
 
 @app.route('/api/stats')
 def get_stats():
-    total_students = count_students()
-    present_today = count_present_today()
-    now = datetime.now()
-    
-    return jsonify({
-        'totalStudents': total_students,
-        'presentToday': present_today,
-        'date': now.strftime('%Y-%m-%d'),
-        'time': now.strftime('%H:%M:%S')
-    })
+    return jsonify(current_stats())
+
+# Server-Sent Events: recognition events, stats and new attendance rows are
+# pushed as they happen instead of every open tab polling for them
+@app.route('/api/stream')
+def event_stream():
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    return Response(event_hub.stream(last_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/api/attendance')
 def get_attendance():
@@ -278,8 +338,7 @@ def get_attendance():
 
 @app.route('/api/report', methods=['GET'])
 def get_report():
-    start_date = request.args.get('start_date', (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d'))
-    end_date = request.args.get('end_date', datetime.now().strftime('%Y-%m-%d'))
+    start_date, end_date = report_dates(request.args.get('start_date'), request.args.get('end_date'))
     
     report_data = get_attendance_report(start_date, end_date)
     return jsonify(report_data)
@@ -312,20 +371,17 @@ def toggle_registration_camera():
 
 @app.route('/api/capture_registration_image', methods=['GET'])
 def capture_registration_image():
-    global registration_frame
-    
-    with frame_lock:
-        if registration_frame is not None:
-            ret, buffer = cv2.imencode('.jpg', registration_frame)
-            captured_image = base64.b64encode(buffer).decode('utf-8')
-            return jsonify({'success': True, 'image': captured_image})
-        else:
-            return jsonify({'success': False, 'message': 'No camera frame available'})
+    # Snapshot the broker's latest raw frame, without the preview overlay
+    seq, registration_frame, captured_at = get_broker(REGISTRATION_SOURCE).latest()
+    if registration_frame is not None:
+        ret, buffer = cv2.imencode('.jpg', registration_frame)
+        captured_image = base64.b64encode(buffer).decode('utf-8')
+        return jsonify({'success': True, 'image': captured_image})
+    else:
+        return jsonify({'success': False, 'message': 'No camera frame available'})
 
 @app.route('/register', methods=['POST'])
 def register_student():
-    global classNames, encodeListKnown
-    
     # Handle the photo from capture or file upload
     name = request.form.get('name')
     
@@ -363,9 +419,10 @@ def register_student():
         try:
             new_encode = face_recognition.face_encodings(new_img)[0]
             
-            with frame_lock:  # Lock to safely modify shared resources
-                encodeListKnown.append(new_encode)
-                classNames.append(name)
+            # Publishes a new gallery snapshot; the recognition loop picks it
+            # up on its next frame
+            known_gallery.add(name, new_encode)
+            event_hub.publish('stats', current_stats())
                 
             return jsonify({'success': True, 'message': 'Student registered successfully'})
         except IndexError:
@@ -375,106 +432,109 @@ def register_student():
     else:
         return jsonify({'success': False, 'message': 'Failed to process the uploaded image'})
 
+# How old frames are at each pipeline checkpoint, per camera (p50/p95/p99
+# over the last 1000 frames); "encoded" is capture-to-display
+@app.route('/api/debug/latency')
+def get_latency():
+    camera_id = request.args.get('camera')
+    cameras = {cid: p for cid, p in list(recognition_pipelines.items()) if camera_id in (None, cid)}
+    if camera_id is not None and not cameras:
+        return jsonify({'success': False, 'message': f'Unknown camera: {camera_id}'}), 404
+    return jsonify({cid: p.latency.summary() for cid, p in cameras.items()})
+
+@app.route('/metrics')
+def get_metrics():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+# Admin endpoints need the token, or a local request when none is set
+def admin_allowed():
+    if ADMIN_TOKEN is not None:
+        return request.headers.get('X-Admin-Token') == ADMIN_TOKEN
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+# Start a time-limited profile of the recognition and request threads. The
+# dump is in folded-stack format for flamegraph.pl / speedscope; with
+# ?wait=1 it is returned directly, otherwise fetch it from
+# /admin/profile/<name> once done.
+@app.route('/admin/profile', methods=['POST'])
+def start_profile():
+    if not admin_allowed():
+        return jsonify({'success': False, 'message': 'Forbidden'}), 403
+    options = request.get_json(silent=True) or request.args
+    threads = options.get('threads')
+    if isinstance(threads, str):
+        threads = [t for t in threads.split(',') if t]
+    try:
+        capture = profile_capture.start(options.get('seconds', 10), options.get('interval', 0.005), threads)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'seconds and interval must be numbers'}), 400
+    if capture is None:
+        return jsonify({'success': False, 'message': 'A profile is already running'}), 409
+    if str(options.get('wait', '')).lower() in ('1', 'true'):
+        profile_capture.wait()
+        return send_from_directory(profile_capture.directory, capture['name'], mimetype='text/plain')
+    return jsonify({'success': True, 'profile': capture})
+
+@app.route('/admin/profile', methods=['GET'])
+def profile_status():
+    if not admin_allowed():
+        return jsonify({'success': False, 'message': 'Forbidden'}), 403
+    return jsonify(profile_capture.status())
+
+@app.route('/admin/profile/<name>')
+def get_profile(name):
+    if not admin_allowed():
+        return jsonify({'success': False, 'message': 'Forbidden'}), 403
+    if profile_capture.path(name) is None:
+        return jsonify({'success': False, 'message': f'No profile named {name}'}), 404
+    return send_from_directory(profile_capture.directory, name, mimetype='text/plain')
+
 @app.route('/templates/<path:path>')
 def serve_template(path):
     return send_from_directory('templates', path)
 
-# Face recognition thread
-def face_recognition_thread():
-    global current_frame, recognition_events, classNames, encodeListKnown, camera_running
-    
-    # Start webcam
-    cap = cv2.VideoCapture(0)
-    
-    if not cap.isOpened():
-        print("Error: Could not open webcam")
-        return
-    
-    print("Starting face recognition thread")
-    
-    while True:
-        if camera_running and not registration_camera_running:
-            success, img = cap.read()
-            if not success:
-                print("Failed to get frame from webcam")
-                time.sleep(1)  # Wait before retrying
-                cap = cv2.VideoCapture(0)  # Try to reconnect
-                continue
-            
-            # Make a copy of the image for processing
-            imgS = cv2.resize(img, (0, 0), None, 0.25, 0.25)  # Resize for faster processing
-            imgS = cv2.cvtColor(imgS, cv2.COLOR_BGR2RGB)
-            
-            # Check if there are any encodings
-            if len(encodeListKnown) == 0:
-                # Just display the frame with a message if no faces are registered
-                cv2.putText(img, "No faces registered", (10, 50), cv2.FONT_HERSHEY_COMPLEX, 1, (0, 0, 255), 2)
-                with frame_lock:
-                    current_frame = img
-                time.sleep(0.03)
-                continue
-            
-            # Find all faces in current frame
-            facesCurFrame = face_recognition.face_locations(imgS)
-            encodesCurFrame = face_recognition.face_encodings(imgS, facesCurFrame)
-            
-            # Check each face against known encodings
-            for encodeFace, faceLoc in zip(encodesCurFrame, facesCurFrame):
-                with frame_lock:  # Lock when accessing shared resources
-                    local_encodeListKnown = encodeListKnown.copy()
-                    local_classNames = classNames.copy()
-                
-                matches = face_recognition.compare_faces(local_encodeListKnown, encodeFace)
-                faceDis = face_recognition.face_distance(local_encodeListKnown, encodeFace)
-                
-                if len(faceDis) > 0:  # Check if the list is not empty
-                    matchIndex = np.argmin(faceDis)
-                    
-                    # If match found, mark attendance
-                    if matches[matchIndex]:
-                        name = local_classNames[matchIndex].upper()
-                        attendance_status = markAttendance(name)
-                        
-                        # Add to recognition events
-                        now = datetime.now()
-                        event = {
-                            'name': name,
-                            'status': 'Marked' if 'Marked' in attendance_status else 'Already Marked',
-                            'time': now.strftime('%H:%M:%S')
-                        }
-                        recognition_events.insert(0, event)
-                        if len(recognition_events) > 20:
-                            recognition_events.pop()
-                        
-                        # Draw rectangle and name
-                        y1, x2, y2, x1 = faceLoc
-                        # Scale back up face locations since we scaled down the image
-                        y1, x2, y2, x1 = y1*4, x2*4, y2*4, x1*4
-                        cv2.rectangle(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                        cv2.rectangle(img, (x1, y2-35), (x2, y2), (0, 255, 0), cv2.FILLED)
-                        cv2.putText(img, attendance_status, (x1+6, y2-6), cv2.FONT_HERSHEY_COMPLEX, 0.5, (255, 255, 255), 1)
-                    else:
-                        # Unknown face
-                        y1, x2, y2, x1 = faceLoc
-                        y1, x2, y2, x1 = y1*4, x2*4, y2*4, x1*4
-                        cv2.rectangle(img, (x1, y1), (x2, y2), (0, 0, 255), 2)
-                        cv2.rectangle(img, (x1, y2-35), (x2, y2), (0, 0, 255), cv2.FILLED)
-                        cv2.putText(img, "Unknown", (x1+6, y2-6), cv2.FONT_HERSHEY_COMPLEX, 0.5, (255, 255, 255), 1)
-            
-            # Update the current frame
-            with frame_lock:
-                current_frame = img
-        else:
-            # Release camera when not in use
-            if cap.isOpened():
-                time.sleep(0.1)  # Sleep briefly to reduce CPU usage
-            else:
-                cap = cv2.VideoCapture(0)
-        
-        # Sleep to reduce CPU usage
-        time.sleep(0.03)
-    
-    cap.release()
+# Add a recognition event for the dashboard
+def add_recognition_event(camera_id, name, attendance_status):
+    now = datetime.now()
+    event = {
+        'name': name,
+        'status': 'Marked' if 'Marked' in attendance_status else 'Already Marked',
+        'time': now.strftime('%H:%M:%S'),
+        'camera': camera_id
+    }
+    recognition_events.insert(0, event)
+    if len(recognition_events) > 20:
+        recognition_events.pop()
+    event_hub.publish('recognition', event)
+
+# Hand the annotated frame to the streamers, with the pipeline frame it was
+# drawn from so capture-to-display latency can be traced
+def publish_frame(camera_id, img, frame=None):
+    pipeline = recognition_pipelines.get(camera_id)
+    get_broadcaster(camera_id).publish(img, frame, pipeline.latency if pipeline is not None else None)
+
+# Face recognition thread for one camera. All cameras share the gallery and
+# the attendance ledger; only tracking and scheduling are per camera.
+def face_recognition_thread(camera):
+    camera_id = camera['id']
+    pipeline = RecognitionPipeline(
+        open_capture=lambda: get_broker(camera['source']).subscribe(),
+        gallery=known_gallery,
+        mark_attendance=markAttendance,
+        on_event=lambda name, status: add_recognition_event(camera_id, name, status),
+        publish=lambda img, frame: publish_frame(camera_id, img, frame),
+        is_active=lambda: camera_running and not registration_camera_running,
+        name=camera_id,
+        tolerance=MATCH_TOLERANCE,
+        detect_workers=PIPELINE_WORKERS,
+        encode_workers=PIPELINE_WORKERS,
+        pool=PIPELINE_POOL,
+        tracker=FaceTracker(reverify_interval=3.0),
+        scheduler=DetectionScheduler(target_fps=20, latency_budget=0.25),
+        latency_overlay=LATENCY_OVERLAY,
+    )
+    recognition_pipelines[camera_id] = pipeline
+    pipeline.run()
 
 # Create the templates directory and save the HTML
 def setup_templates():
@@ -1673,6 +1733,36 @@ def setup_templates():
             }
         }
         
+        // Add one student's row to the attendance list
+        function addAttendanceItem(student) {
+            const attendanceList = document.getElementById('attendance-list');
+            
+            // Clear the "no records" message if it is showing
+            if (attendanceList.children.length === 1 && 
+                attendanceList.children[0].textContent.includes('No attendance records')) {
+                attendanceList.innerHTML = '';
+            }
+            
+            const item = document.createElement('div');
+            item.className = 'attendance-item';
+            
+            const name = student.name.split('-')[0]; // Strip ID if included in name
+            const initials = name.split(' ').map(n => n[0]).join('');
+            
+            item.innerHTML = `
+                <div class="attendance-avatar">
+                    ${initials}
+                </div>
+                <div class="attendance-details">
+                    <div class="attendance-name">${name}</div>
+                    <div class="attendance-time">${student.time}</div>
+                </div>
+                <div class="attendance-status">${student.status}</div>
+            `;
+            
+            attendanceList.appendChild(item);
+        }
+        
         // Function to fetch and update attendance data
         async function fetchAttendanceData() {
             try {
@@ -1693,26 +1783,7 @@ def setup_templates():
                 }
                 
                 // Add attendance entries
-                attendanceData.forEach(student => {
-                    const item = document.createElement('div');
-                    item.className = 'attendance-item';
-                    
-                    const name = student.name.split('-')[0]; // Strip ID if included in name
-                    const initials = name.split(' ').map(n => n[0]).join('');
-                    
-                    item.innerHTML = `
-                        <div class="attendance-avatar">
-                            ${initials}
-                        </div>
-                        <div class="attendance-details">
-                            <div class="attendance-name">${name}</div>
-                            <div class="attendance-time">${student.time}</div>
-                        </div>
-                        <div class="attendance-status">${student.status}</div>
-                    `;
-                    
-                    attendanceList.appendChild(item);
-                });
+                attendanceData.forEach(addAttendanceItem);
             } catch (error) {
                 console.error('Error fetching attendance data:', error);
             }
@@ -1843,18 +1914,23 @@ def setup_templates():
             }
         }
         
+        // Show the header numbers
+        function showStats(stats) {
+            document.getElementById('total-students').textContent = stats.totalStudents;
+            document.getElementById('present-today').textContent = stats.presentToday;
+            document.getElementById('current-date').textContent = new Date(stats.date).toLocaleDateString('en-US', { 
+                year: 'numeric', month: 'short', day: 'numeric' 
+            });
+            document.getElementById('current-time').textContent = stats.time;
+        }
+        
         // Function to update stats
         async function updateStats() {
             try {
                 const response = await fetch('/api/stats');
                 const stats = await response.json();
                 
-                document.getElementById('total-students').textContent = stats.totalStudents;
-                document.getElementById('present-today').textContent = stats.presentToday;
-                document.getElementById('current-date').textContent = new Date(stats.date).toLocaleDateString('en-US', { 
-                    year: 'numeric', month: 'short', day: 'numeric' 
-                });
-                document.getElementById('current-time').textContent = stats.time;
+                showStats(stats);
                 
                 // Update connection status
                 connectionIndicator.className = 'connection-indicator connected';
@@ -1878,6 +1954,42 @@ def setup_templates():
             fetchAttendanceData();
         }
         
+        // Receive events, stats and new attendance rows as the server pushes them
+        function subscribeToUpdates() {
+            const source = new EventSource('/api/stream');
+            
+            source.onopen = () => {
+                connectionIndicator.className = 'connection-indicator connected';
+                connectionText.textContent = 'Connected';
+            };
+            
+            source.onerror = () => {
+                // The browser reconnects on its own and resumes where it left off
+                connectionIndicator.className = 'connection-indicator connecting';
+                connectionText.textContent = 'Reconnecting...';
+            };
+            
+            source.addEventListener('recognition', e => {
+                const event = JSON.parse(e.data);
+                addRecognitionEvent(event.name, event.status, event.time);
+            });
+            
+            source.addEventListener('stats', e => {
+                showStats(JSON.parse(e.data));
+            });
+            
+            source.addEventListener('attendance', e => {
+                const row = JSON.parse(e.data);
+                // Only rows for the day being viewed belong in the list
+                if (row.date === document.getElementById('attendance-date').value) {
+                    addAttendanceItem(row);
+                }
+            });
+            
+            // Too much was missed while disconnected; reload everything once
+            source.addEventListener('resync', checkConnection);
+        }
+        
         // Initialize everything when page loads
         document.addEventListener('DOMContentLoaded', () => {
             checkConnection();
@@ -1888,24 +2000,38 @@ def setup_templates():
             cameraFeed.style.display = 'none';
             cameraOffMessage.style.display = 'flex';
             
-            // Set up periodic updates
-            setInterval(updateStats, 10000); // Every 10 seconds
-            setInterval(fetchEvents, 5000); // Every 5 seconds
-            setInterval(fetchAttendanceData, 15000); // Every 15 seconds
+            if (window.EventSource) {
+                subscribeToUpdates();
+            } else {
+                // Older browsers fall back to periodic updates
+                setInterval(updateStats, 10000); // Every 10 seconds
+                setInterval(fetchEvents, 5000); // Every 5 seconds
+                setInterval(fetchAttendanceData, 15000); // Every 15 seconds
+            }
         });
     </script>
 </body>
 </html>
         """)
 
-if __name__ == '__main__':
+# Everything the app needs besides the web server itself (shared by the
+# Flask server below and the async server in asgi.py)
+def start_background_services():
     # Setup templates directory and save HTML
     setup_templates()
     
-    # Start face recognition in a background thread
-    thread = threading.Thread(target=face_recognition_thread)
-    thread.daemon = True
-    thread.start()
+    # Replay any rows a crash left in the journal, then start writing in the background
+    attendance_writer.start()
+    
+    # Start face recognition for every camera in background threads
+    for camera in CAMERAS:
+        thread = threading.Thread(target=face_recognition_thread, args=(camera,),
+                                  name=f"recognition-{camera['id']}")
+        thread.daemon = True
+        thread.start()
+
+if __name__ == '__main__':
+    start_background_services()
     
     print("Starting Flask server...")
     # Start Flask server
@@ -0,0 +1,185 @@
+import bisect
+import threading
+
+# Seconds; spans a fast resize up to a slow detection pass under load
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def label_text(names, values, extra=''):
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class HistogramChild:
+    __slots__ = ('bounds', 'counts', 'sum', '_lock')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        # Buckets are upper-inclusive, as Prometheus' "le" expects
+        i = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+
+class Metric:
+    """A named metric with one child per combination of label values.
+
+    Look children up once with ``labels`` and keep them: recording is then a
+    lock-protected add, cheap enough for the per-frame path.
+    """
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def collect(self):
+        lines = self.header()
+        for values, child in list(self._children.items()):
+            lines.append(f'{self.name}{label_text(self.labelnames, values)} {format_value(child.value)}')
+        return lines
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.bounds = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return HistogramChild(self.bounds)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def collect(self):
+        lines = self.header()
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.bounds + (float('inf'),), counts):
+                cumulative += count
+                le = label_text(self.labelnames, values, f'le="{format_value(bound)}"')
+                lines.append(f'{self.name}_bucket{le} {cumulative}')
+            labels = label_text(self.labelnames, values)
+            lines.append(f'{self.name}_sum{labels} {format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class CallbackMetric:
+    """A gauge or counter whose samples are read from the app when scraped.
+
+    ``callback`` returns (label values, value) pairs, so state the app keeps
+    anyway (pipeline stats, viewer counts, gallery size) costs nothing
+    between scrapes.
+    """
+
+    def __init__(self, name, documentation, kind, labelnames, callback):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def collect(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for values, value in self.callback():
+            lines.append(f'{self.name}{label_text(self.labelnames, values)} {format_value(value)}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name, documentation, kind, labelnames, callback):
+        return self.register(CallbackMetric(name, documentation, kind, labelnames, callback))
+
+    def render(self):
+        """Everything in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            try:
+                lines.extend(metric.collect())
+            except Exception as e:
+                print(f"Failed to collect metric {metric.name}: {e}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'attendance_stage_seconds', 'Time spent in each recognition stage', ('camera', 'stage'))
+JPEG_ENCODE_SECONDS = REGISTRY.histogram(
+    'attendance_jpeg_encode_seconds', 'Time to resize and JPEG-encode one stream frame', ('variant',))
+REQUEST_SECONDS = REGISTRY.histogram(
+    'attendance_http_request_seconds', 'Time to produce an HTTP response (streams: until it starts)',
+    ('route', 'method', 'status'))
@@ -0,0 +1,420 @@
+import collections
+import itertools
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import cv2
+import face_recognition
+
+from metrics import STAGE_SECONDS
+from scheduling import DetectionScheduler
+from tracing import LatencyTracker
+from tracking import FaceTracker
+
+
+class DropOldestQueue:
+    """Bounded FIFO whose ``put`` never blocks: when full, the oldest item is dropped.
+
+    A slow consumer therefore always works on recent items instead of a
+    growing backlog of stale ones.
+    """
+
+    def __init__(self, maxsize=2):
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, item):
+        """Add an item and return the one it pushed out, if any."""
+        dropped = None
+        with self._cond:
+            if len(self._items) >= self.maxsize:
+                dropped = self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+        return dropped
+
+    def get(self, timeout=None):
+        with self._cond:
+            if not self._items:
+                self._cond.wait(timeout)
+            return self._items.popleft() if self._items else None
+
+    def get_latest(self, timeout=None):
+        """Take the newest item; older ones still waiting are dropped."""
+        with self._cond:
+            if not self._items:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            item = self._items.pop()
+            self.dropped += len(self._items)
+            self._items.clear()
+            return item
+
+
+class Frame:
+    __slots__ = ('seq', 'image', 'captured_at', 'trace_id')
+
+    def __init__(self, seq, image, captured_at, trace_id=None):
+        self.seq = seq
+        self.image = image
+        self.captured_at = captured_at
+        self.trace_id = trace_id
+
+
+class StageStats:
+    __slots__ = ('processed', 'dropped', 'errors', 'busy')
+
+    def __init__(self):
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.busy = 0.0
+
+    def as_dict(self):
+        return {'processed': self.processed, 'dropped': self.dropped,
+                'errors': self.errors, 'busy_seconds': round(self.busy, 3)}
+
+
+# Quarter-size RGB copy of a frame, which is what detection and encoding run on
+def shrink_frame(img):
+    small = cv2.resize(img, (0, 0), None, 0.25, 0.25)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+
+
+# Draw a face box (in quarter-scale coordinates) and its label
+def draw_face(img, faceLoc, label, known):
+    color = (0, 255, 0) if known else (0, 0, 255)
+    y1, x2, y2, x1 = faceLoc
+    # Scale back up face locations since we scaled down the image
+    y1, x2, y2, x1 = y1*4, x2*4, y2*4, x1*4
+    cv2.rectangle(img, (x1, y1), (x2, y2), color, 2)
+    cv2.rectangle(img, (x1, y2-35), (x2, y2), color, cv2.FILLED)
+    cv2.putText(img, label, (x1+6, y2-6), cv2.FONT_HERSHEY_COMPLEX, 0.5, (255, 255, 255), 1)
+
+
+class RecognitionPipeline:
+    """Recognition for one camera, split into stages joined by drop-oldest queues.
+
+    capture   reads frames and hands them to detect and to annotate
+    detect    shrinks a frame and finds faces on a worker pool, then updates
+              the tracker (passes are spaced out by the detection scheduler)
+    encode    encodes the tracks that need it on a worker pool, matches them
+              against the gallery snapshot and marks attendance
+    annotate  draws the current tracks on the freshest frame and publishes it
+
+    A slow stage only ever drops old work, so capture never stalls and the
+    preview always shows the newest frame. Each frame carries a trace id and
+    its capture time, and ``latency`` records how old it is at every stage;
+    ``latency_overlay`` prints that on the streamed frame. ``pool='process'`` runs the
+    detect/encode workers in separate processes, which helps when the
+    face_recognition calls hold the GIL.
+    """
+
+    STAGES = ('capture', 'detect', 'encode', 'annotate')
+    # Steps whose durations go to the attendance_stage_seconds histogram
+    TIMED_STEPS = ('resize', 'cvtColor', 'face_locations', 'face_encodings', 'matching', 'markAttendance',
+                   'drawing')
+
+    def __init__(self, open_capture, gallery, mark_attendance, on_event, publish, is_active,
+                 name='camera', tolerance=0.6, detect_workers=2, encode_workers=2, pool='thread', queue_size=2,
+                 tracker=None, scheduler=None, latency_overlay=False):
+        self.name = name
+        self.open_capture = open_capture
+        self.gallery = gallery
+        self.mark_attendance = mark_attendance
+        self.on_event = on_event
+        self.publish = publish
+        self.is_active = is_active
+        self.tolerance = tolerance
+        self.tracker = tracker if tracker is not None else FaceTracker()
+        self.scheduler = scheduler if scheduler is not None else DetectionScheduler()
+
+        # Thread names start with recognition-<camera> so profiles can pick them out
+        if pool == 'process':
+            self.detect_pool = ProcessPoolExecutor(max_workers=detect_workers)
+            self.encode_pool = ProcessPoolExecutor(max_workers=encode_workers)
+        else:
+            self.detect_pool = ThreadPoolExecutor(detect_workers, thread_name_prefix=f'recognition-{name}-detect')
+            self.encode_pool = ThreadPoolExecutor(encode_workers, thread_name_prefix=f'recognition-{name}-encode')
+        self._detect_slots = threading.BoundedSemaphore(detect_workers)
+        self._encode_slots = threading.BoundedSemaphore(encode_workers)
+
+        self.detect_queue = DropOldestQueue(queue_size)
+        self.encode_queue = DropOldestQueue(queue_size)
+        self.stats = {stage: StageStats() for stage in self.STAGES}
+        self.timings = {step: STAGE_SECONDS.labels(name, step) for step in self.TIMED_STEPS}
+        self.latency = LatencyTracker()
+        self.latency_overlay = latency_overlay
+        self.fps = 0.0
+
+        self._seq = itertools.count(1)
+        self._latest = None
+        self._frame_cond = threading.Condition()
+        self._track_lock = threading.Lock()
+        self._last_tracked = 0
+        self._stop = threading.Event()
+        self._threads = []
+
+    def run(self):
+        """Start the stages and run capture on the calling thread until stopped."""
+        for stage, target in (('detect', self._detect_loop), ('encode', self._encode_loop),
+                              ('annotate', self._annotate_loop)):
+            thread = threading.Thread(target=target, name=f'recognition-{self.name}-{stage}-loop', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        try:
+            self._capture_loop()
+        finally:
+            self.stop()
+
+    def stop(self):
+        self._stop.set()
+        with self._frame_cond:
+            self._frame_cond.notify_all()
+        self.detect_pool.shutdown(wait=False, cancel_futures=True)
+        self.encode_pool.shutdown(wait=False, cancel_futures=True)
+
+    def snapshot_stats(self):
+        stats = {stage: s.as_dict() for stage, s in self.stats.items()}
+        stats['detect']['dropped'] += self.detect_queue.dropped
+        stats['encode']['dropped'] += self.encode_queue.dropped
+        stats['detect']['queued'] = len(self.detect_queue)
+        stats['encode']['queued'] = len(self.encode_queue)
+        return stats
+
+    def _capture_loop(self):
+        cap = self.open_capture()
+        if not cap.isOpened():
+            print(f"Error: Could not open camera {self.name}")
+            return
+
+        print(f"Starting face recognition for camera {self.name}")
+        stats = self.stats['capture']
+        last_capture = None
+        while not self._stop.is_set():
+            if not self.is_active():
+                time.sleep(0.1)  # Sleep briefly to reduce CPU usage
+                continue
+
+            frame_start = time.monotonic()
+            success, img = cap.read()
+            if not success and getattr(cap, 'ended', False):
+                # A replayed source that does not loop has run out
+                print(f"Camera {self.name} has no more frames; stopping recognition")
+                break
+            if not success:
+                print(f"Failed to get frame from camera {self.name}")
+                time.sleep(1)  # Wait before retrying
+                cap.release()
+                cap = self.open_capture()  # Try to reconnect
+                continue
+
+            # Prefer the time the device delivered the frame, when the
+            # capture knows it (the shared camera broker does)
+            seq = next(self._seq)
+            frame = Frame(seq, img, getattr(cap, 'captured_at', None) or time.monotonic(), f'{self.name}-{seq}')
+            # Smoothed capture rate for the metrics endpoint
+            if last_capture is not None and frame.captured_at > last_capture:
+                rate = 1.0 / (frame.captured_at - last_capture)
+                self.fps = rate if self.fps == 0.0 else self.fps + 0.1 * (rate - self.fps)
+            last_capture = frame.captured_at
+            with self._frame_cond:
+                self._latest = frame
+                self._frame_cond.notify_all()
+            self.detect_queue.put(frame)
+            stats.processed += 1
+
+            # Hold capture to the target FPS
+            time.sleep(self.scheduler.frame_delay(frame_start))
+        cap.release()
+
+    def _detect_loop(self):
+        while not self._stop.is_set():
+            if len(self.gallery) == 0 or not self.scheduler.should_detect():
+                time.sleep(0.01)
+                continue
+            # Wait for a free worker first so the frame taken is the freshest
+            if not self._detect_slots.acquire(timeout=0.1):
+                continue
+            frame = self.detect_queue.get_latest(timeout=0.1)
+            if frame is None:
+                self._detect_slots.release()
+                continue
+
+            start = time.monotonic()
+            self.scheduler.begin(start)
+            try:
+                # shrink_frame, timed step by step
+                small = cv2.resize(frame.image, (0, 0), None, 0.25, 0.25)
+                resized = time.monotonic()
+                small = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+                converted = time.monotonic()
+                self.timings['resize'].observe(resized - start)
+                self.timings['cvtColor'].observe(converted - resized)
+                future = self.detect_pool.submit(face_recognition.face_locations, small)
+            except RuntimeError:
+                # The pool was shut down while stopping
+                self._detect_slots.release()
+                return
+            future.add_done_callback(lambda f, frame=frame, small=small, start=start, converted=converted:
+                                     self._on_detected(frame, small, start, converted, f))
+
+    def _on_detected(self, frame, small, start, converted, future):
+        stats = self.stats['detect']
+        try:
+            if future.cancelled():
+                return
+            try:
+                boxes = future.result()
+            except Exception as e:
+                stats.errors += 1
+                print(f"Face detection failed: {e}")
+                return
+
+            detected = time.monotonic()
+            duration = detected - start
+            self.timings['face_locations'].observe(detected - converted)
+            stats.processed += 1
+            stats.busy += duration
+
+            with self._track_lock:
+                # A pass that finished after a newer one carries stale boxes
+                if frame.seq < self._last_tracked:
+                    stats.dropped += 1
+                    self.scheduler.record(duration)
+                    return
+                self._last_tracked = frame.seq
+                tracks = self.tracker.update(boxes)
+                self.latency.since('detected', frame.captured_at, frame.trace_id)
+                pending = [t for t in tracks if not t.encoding and self.tracker.needs_encoding(t)]
+                for track in pending:
+                    track.encoding = True
+
+            # The scheduler hears about the pass once its faces are matched,
+            # so it paces detection by the whole detect/encode/match cost
+            if not pending:
+                self.scheduler.record(duration)
+                return
+            dropped = self.encode_queue.put((frame, small, pending, duration))
+            if dropped is not None:
+                # Let the next detection pass pick these tracks up again
+                for track in dropped[2]:
+                    track.encoding = False
+                self.scheduler.record(dropped[3])
+        finally:
+            self._detect_slots.release()
+
+    def _encode_loop(self):
+        while not self._stop.is_set():
+            if not self._encode_slots.acquire(timeout=0.1):
+                continue
+            job = self.encode_queue.get(timeout=0.1)
+            if job is None:
+                self._encode_slots.release()
+                continue
+
+            frame, small, tracks, detect_duration = job
+            start = time.monotonic()
+            try:
+                future = self.encode_pool.submit(face_recognition.face_encodings, small,
+                                                 [track.box for track in tracks])
+            except RuntimeError:
+                self._encode_slots.release()
+                return
+            future.add_done_callback(lambda f, frame=frame, tracks=tracks, start=start, d=detect_duration:
+                                     self._on_encoded(frame, tracks, start, d, f))
+
+    def _on_encoded(self, frame, tracks, start, detect_duration, future):
+        stats = self.stats['encode']
+        try:
+            if future.cancelled():
+                return
+            try:
+                encodings = future.result()
+            except Exception as e:
+                stats.errors += 1
+                print(f"Face encoding failed: {e}")
+                for track in tracks:
+                    track.encoding = False
+                self.scheduler.record(detect_duration)
+                return
+
+            encoded = time.monotonic()
+            self.timings['face_encodings'].observe(encoded - start)
+
+            # Match every face from the pass against the gallery in one go
+            gallery = self.gallery.snapshot
+            matchIndexes, faceDis = gallery.search(encodings)
+            self.timings['matching'].observe(time.monotonic() - encoded)
+            for track, matchIndex, distance in zip(tracks, matchIndexes, faceDis):
+                # If match found, mark attendance
+                if distance <= self.tolerance:
+                    name = gallery.names[matchIndex].upper()
+                    marking = time.monotonic()
+                    attendance_status = self.mark_attendance(name)
+                    self.timings['markAttendance'].observe(time.monotonic() - marking)
+                    # Add a recognition event when the track gets a new identity
+                    if track.name != name:
+                        self.on_event(name, attendance_status)
+                    self.tracker.identify(track, name, attendance_status)
+                else:
+                    self.tracker.identify(track, None, "Unknown")
+            self.latency.since('matched', frame.captured_at, frame.trace_id)
+
+            busy = time.monotonic() - start
+            self.scheduler.record(detect_duration + busy)
+            stats.processed += 1
+            stats.busy += busy
+        finally:
+            self._encode_slots.release()
+
+    def _annotate_loop(self):
+        stats = self.stats['annotate']
+        last_seq = 0
+        while not self._stop.is_set():
+            with self._frame_cond:
+                while not self._stop.is_set() and (self._latest is None or self._latest.seq == last_seq):
+                    self._frame_cond.wait(0.5)
+                frame = self._latest
+            if frame is None or self._stop.is_set():
+                continue
+            if frame.seq > last_seq + 1 and last_seq:
+                stats.dropped += frame.seq - last_seq - 1
+            last_seq = frame.seq
+
+            start = time.monotonic()
+            img = frame.image.copy()
+            if len(self.gallery) == 0:
+                # Just display the frame with a message if no faces are registered
+                cv2.putText(img, "No faces registered", (10, 50), cv2.FONT_HERSHEY_COMPLEX, 1, (0, 0, 255), 2)
+            else:
+                # Draw every face with its track's cached identity
+                with self._track_lock:
+                    tracks = [t for t in self.tracker.tracks if t.missed == 0 and t.label is not None]
+                for track in tracks:
+                    draw_face(img, track.box, track.label, track.known)
+            if self.latency_overlay:
+                self._draw_latency(img, frame)
+            self.timings['drawing'].observe(time.monotonic() - start)
+
+            self.latency.since('annotated', frame.captured_at, frame.trace_id)
+            self.publish(img, frame)
+            stats.processed += 1
+            stats.busy += time.monotonic() - start
+
+    # Trace id, this frame's age and the recent capture-to-display p95
+    def _draw_latency(self, img, frame):
+        age = (time.monotonic() - frame.captured_at) * 1000
+        text = f"{frame.trace_id}  age {age:.0f} ms"
+        p95 = self.latency.percentile_ms('encoded', 95)
+        if p95 is not None:
+            text += f"  display p95 {p95:.0f} ms"
+        cv2.putText(img, text, (10, img.shape[0] - 12), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 1)
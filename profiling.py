@@ -0,0 +1,124 @@
+import collections
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+
+# One stack frame as it appears in the dump: function (file:first line)
+def frame_label(code):
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class StackSampler:
+    """Statistical profiler that samples every thread's Python stack.
+
+    A helper thread wakes every ``interval`` seconds and records the stack of
+    each thread (``sys._current_frames``), so the profiled threads run
+    unmodified: no trace or profile hook is installed, and nothing at all
+    runs while no capture is in progress. Only threads whose name starts
+    with one of ``threads`` are kept when it is given. Stacks are counted in
+    the "folded" format (``thread;outer;...;inner count``) that
+    flamegraph.pl, speedscope and inferno read directly.
+    """
+
+    def __init__(self, interval=0.005, threads=None):
+        self.interval = interval
+        self.threads = tuple(threads) if threads else None
+        self.samples = 0
+        self.stacks = collections.Counter()
+
+    def run(self, duration, stop=None):
+        me = threading.get_ident()
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline and not (stop is not None and stop.is_set()):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                name = names.get(ident, str(ident))
+                if ident == me or (self.threads and not name.startswith(self.threads)):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(name)
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+            time.sleep(self.interval)
+        return self
+
+    def folded(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+class ProfileCapture:
+    """Runs one time-limited StackSampler at a time and keeps its dumps.
+
+    Dumps are written to ``directory`` as ``profile-<timestamp>.folded``.
+    A relative ``directory`` is fixed against the working directory at
+    construction, so writing and serving dumps agree on where they are.
+    """
+
+    def __init__(self, directory='profiles', max_seconds=60.0):
+        self.directory = os.path.abspath(directory)
+        self.max_seconds = max_seconds
+        self.current = None
+        self.last = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self, seconds=10.0, interval=0.005, threads=None):
+        """Start a capture in the background; returns its details, or None if one is running."""
+        seconds = min(max(float(seconds), 0.1), self.max_seconds)
+        interval = min(max(float(interval), 0.001), 1.0)
+        with self._lock:
+            if self.current is not None:
+                return None
+            name = datetime.now().strftime('profile-%Y%m%d-%H%M%S.folded')
+            self.current = {'name': name, 'seconds': seconds, 'interval': interval,
+                            'threads': list(threads or []), 'started': datetime.now().isoformat(timespec='seconds')}
+            self._stop.clear()
+            sampler = StackSampler(interval, threads)
+            self._thread = threading.Thread(target=self._run, args=(sampler, seconds, self.current),
+                                            name='profile-sampler', daemon=True)
+            self._thread.start()
+            return dict(self.current)
+
+    def stop(self):
+        self._stop.set()
+
+    def wait(self, timeout=None):
+        thread = getattr(self, '_thread', None)
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self, sampler, seconds, info):
+        try:
+            sampler.run(seconds, self._stop)
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, info['name']), 'w', encoding='utf-8') as f:
+                f.write(sampler.folded())
+            info['samples'] = sampler.samples
+        except Exception as e:
+            info['error'] = str(e)
+            print(f"Profile capture failed: {e}")
+        finally:
+            with self._lock:
+                self.last = info
+                self.current = None
+
+    def dumps(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted((f for f in os.listdir(self.directory) if f.endswith('.folded')), reverse=True)
+
+    def path(self, name):
+        """Path of a stored dump, or None for anything that is not one."""
+        if os.path.basename(name) != name or name not in self.dumps():
+            return None
+        return os.path.join(self.directory, name)
+
+    def status(self):
+        with self._lock:
+            return {'running': self.current, 'last': self.last, 'dumps': self.dumps()}
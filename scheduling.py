@@ -0,0 +1,65 @@
+import time
+
+
+class DetectionScheduler:
+    """Spaces out detection passes so the loop keeps its frame rate under load.
+
+    Frames are still captured and streamed at ``target_fps``; only the
+    detect/encode/match work is scheduled. The cost of each pass is measured in
+    wall time and smoothed, and the next pass is allowed once
+    ``cost / detect_share`` seconds have gone by, so detection uses at most
+    about ``detect_share`` of the loop's time. When other cameras or heavy
+    report queries compete for the CPU the measured cost grows and passes
+    spread out on their own. A pass slower than ``latency_budget`` doubles
+    the back-off until passes are fast again. The interval never exceeds
+    ``max_interval``, so faces are still picked up under heavy load.
+
+    Passes may overlap (several detect workers), so a pass is reserved with
+    ``begin`` when it starts: until it reports back through ``record`` it
+    counts as finishing after the smoothed cost, and the next one waits for
+    that plus the interval instead of starting right behind it.
+    """
+
+    def __init__(self, target_fps=20.0, detect_share=0.6, latency_budget=0.25,
+                 max_interval=1.0, smoothing=0.3):
+        self.frame_interval = 1.0 / target_fps
+        self.detect_share = detect_share
+        self.latency_budget = latency_budget
+        self.max_interval = max_interval
+        self.smoothing = smoothing
+        self.cost = 0.0
+        self.backoff = 1.0
+        self.interval = 0.0
+        self.last_detection = None
+
+    def should_detect(self, now=None):
+        now = time.monotonic() if now is None else now
+        return self.last_detection is None or now - self.last_detection >= self.interval
+
+    def begin(self, now=None):
+        """Reserve a pass that is starting now."""
+        now = time.monotonic() if now is None else now
+        self.last_detection = max(self.last_detection or now, now + self.cost)
+
+    def record(self, duration, now=None):
+        """Feed back how long a detection pass took (detect, encode and match)."""
+        now = time.monotonic() if now is None else now
+        # An older pass finishing late must not undo a newer reservation
+        self.last_detection = max(self.last_detection or now, now)
+        if self.cost == 0.0:
+            self.cost = duration
+        else:
+            self.cost += self.smoothing * (duration - self.cost)
+
+        if duration > self.latency_budget:
+            self.backoff = min(self.backoff * 2.0, 8.0)
+        else:
+            self.backoff = max(1.0, self.backoff * 0.5)
+
+        interval = (self.cost / self.detect_share - self.cost) * self.backoff
+        self.interval = min(max(interval, 0.0), self.max_interval)
+
+    def frame_delay(self, frame_start, now=None):
+        """Seconds to sleep so this frame lasts one target frame interval."""
+        now = time.monotonic() if now is None else now
+        return max(0.0, self.frame_interval - (now - frame_start))
@@ -0,0 +1,301 @@
+"""Frame sources for the capture brokers.
+
+A camera's ``source`` is either anything ``cv2.VideoCapture`` accepts
+(device index, video file, stream URL) or a spec string that picks one of
+the sources below, with options after a ``?``:
+
+    device:0?width=1280&height=720     a local camera with a requested mode
+    video:lecture.mp4?fps=25&loop=1    a recording, replayed at a fixed rate
+    images:frames/?fps=10&loop=1       a folder of images, in name order
+    synthetic:?fps=15&faces=3&seed=7   enrolment photos composited onto backgrounds
+
+A plain path to a folder is read as an image sequence. Replayed and
+synthetic sources pace ``read`` to their ``fps``, so a server without a
+webcam can drive the whole pipeline and the dashboard at a known,
+reproducible load. Every source has the ``isOpened`` / ``read`` /
+``release`` subset of ``cv2.VideoCapture`` that the brokers use. With
+``loop=0`` a replay sets ``ended`` once it runs out, and the broker then
+stops for good instead of reopening it.
+
+    python sources.py "synthetic:?fps=30&faces=5" --frames 300
+    python sources.py "synthetic:?faces=4&seed=3" --frames 1500 --write load.mp4
+"""
+import argparse
+import os
+import random
+import time
+from urllib.parse import parse_qsl
+
+import cv2
+import numpy as np
+
+from gallery import IMAGE_EXTENSIONS, IMAGES_PATH
+
+KINDS = ('device', 'video', 'images', 'synthetic')
+
+
+class Pacer:
+    """Sleeps so successive ``wait`` calls return ``fps`` times a second.
+
+    Ticks follow a fixed schedule rather than "sleep one interval", so the
+    rate does not drift with the time spent producing each frame. A consumer
+    that falls more than a frame behind restarts the schedule instead of
+    getting a burst of frames to catch up.
+    """
+
+    def __init__(self, fps):
+        self.interval = 1.0 / fps if fps and fps > 0 else 0.0
+        self.next_tick = None
+
+    def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if self.next_tick is None or now - self.next_tick > self.interval:
+            self.next_tick = now
+        elif self.next_tick > now:
+            time.sleep(self.next_tick - now)
+        self.next_tick += self.interval
+
+
+class VideoFileSource:
+    """A recording replayed at ``fps`` (default: its own rate), looping at the end."""
+
+    def __init__(self, path, fps=None, loop=True):
+        self.path = path
+        self.loop = loop
+        self.ended = False
+        self.cap = cv2.VideoCapture(path)
+        rate = fps or (self.cap.get(cv2.CAP_PROP_FPS) if self.cap.isOpened() else 0) or 25.0
+        self.pacer = Pacer(rate)
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def read(self):
+        success, img = self.cap.read()
+        if not success and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            success, img = self.cap.read()
+        if not success:
+            self.ended = not self.loop
+            return False, None
+        self.pacer.wait()
+        return success, img
+
+    def release(self):
+        self.cap.release()
+
+
+class ImageSequenceSource:
+    """The images of a folder in name order, one per frame at ``fps``."""
+
+    def __init__(self, directory, fps=10.0, loop=True):
+        self.loop = loop
+        self.ended = False
+        self.pacer = Pacer(fps)
+        self.index = 0
+        self.files = []
+        if os.path.isdir(directory):
+            self.files = sorted(os.path.join(directory, f) for f in os.listdir(directory)
+                                if f.lower().endswith(IMAGE_EXTENSIONS))
+
+    def isOpened(self):
+        return bool(self.files)
+
+    def read(self):
+        # Unreadable files are skipped; a read only fails at the end of a
+        # sequence that does not loop, or when nothing in it can be read
+        for _ in range(len(self.files)):
+            if self.index >= len(self.files):
+                if not self.loop:
+                    break
+                self.index = 0
+            path = self.files[self.index]
+            self.index += 1
+            img = cv2.imread(path)
+            if img is not None:
+                self.pacer.wait()
+                return True, img
+            print(f"Could not read image: {path}")
+        self.ended = not self.loop
+        return False, None
+
+    def release(self):
+        self.files = []
+
+
+class SyntheticSource:
+    """Enrolment photos moving over background scenes, for load tests.
+
+    Each frame shows ``faces`` people from ``images`` drifting slowly around
+    the frame, so the tracker sees continuous motion; every ``dwell`` seconds
+    of stream time a different group takes their place. Backgrounds come
+    from ``backgrounds`` (a folder of images) or are generated. The content
+    depends only on ``seed`` and the frame number, never on wall time, so
+    two runs with the same spec produce the same frames.
+    """
+
+    def __init__(self, images=IMAGES_PATH, backgrounds=None, fps=15.0, faces=1, size='640x480',
+                 face_height=0.4, dwell=10.0, seed=0):
+        self.width, self.height = (int(v) for v in str(size).lower().split('x'))
+        self.faces = max(0, int(faces))
+        self.face_height = face_height
+        self.dwell_frames = max(1, int(dwell * (fps or 15.0)))
+        self.seed = seed
+        self.pacer = Pacer(fps)
+        self.index = 0
+        self.photos = self._load(images)
+        rng = np.random.default_rng(seed)
+        self.backgrounds = [cv2.resize(img, (self.width, self.height)) for img in self._load(backgrounds)]
+        if not self.backgrounds:
+            self.backgrounds = [self._generate_background(rng) for _ in range(4)]
+
+    def _load(self, directory):
+        if not directory or not os.path.isdir(directory):
+            return []
+        images = []
+        for f in sorted(os.listdir(directory)):
+            if f.lower().endswith(IMAGE_EXTENSIONS):
+                img = cv2.imread(os.path.join(directory, f))
+                if img is not None:
+                    images.append(img)
+        return images
+
+    # A smooth two-colour gradient with a little noise, like an evenly lit room
+    def _generate_background(self, rng):
+        top, bottom = rng.integers(40, 200, size=(2, 3))
+        ramp = np.linspace(0.0, 1.0, self.height)[:, None, None]
+        background = np.broadcast_to(top + (bottom - top) * ramp, (self.height, self.width, 3))
+        noise = rng.normal(0, 4, size=(self.height, self.width, 3))
+        return np.clip(background + noise, 0, 255).astype(np.uint8)
+
+    def isOpened(self):
+        return bool(self.photos) or self.faces == 0
+
+    def scene(self, index):
+        """The frame numbered ``index``; reading advances through these."""
+        group = index // self.dwell_frames
+        rng = random.Random(f'{self.seed}-{group}')
+        frame = rng.choice(self.backgrounds).copy()
+        count = min(self.faces, len(self.photos))
+        if not count:
+            return frame
+
+        # Each person gets a column of the frame to drift around in, so
+        # photos never overlap and every face stays fully visible
+        column = self.width // count
+        t = (index % self.dwell_frames) / self.dwell_frames
+        for slot, photo in enumerate(rng.sample(self.photos, count)):
+            h = int(self.height * self.face_height)
+            w = min(column, max(1, int(photo.shape[1] * h / photo.shape[0])))
+            h = min(h, max(1, int(photo.shape[0] * w / photo.shape[1])))
+            phase = rng.uniform(0, 2 * np.pi)
+            x = slot * column + int((column - w) * (0.5 + 0.5 * np.sin(phase + 2 * np.pi * t)))
+            y = int((self.height - h) * (0.5 + 0.4 * np.cos(phase + 2 * np.pi * t)))
+            frame[y:y + h, x:x + w] = cv2.resize(photo, (w, h))
+        return frame
+
+    def read(self):
+        frame = self.scene(self.index)
+        self.index += 1
+        self.pacer.wait()
+        return True, frame
+
+    def release(self):
+        pass
+
+
+def open_device(index, width=None, height=None, fps=None):
+    cap = cv2.VideoCapture(int(index))
+    for prop, value in ((cv2.CAP_PROP_FRAME_WIDTH, width), (cv2.CAP_PROP_FRAME_HEIGHT, height),
+                        (cv2.CAP_PROP_FPS, fps)):
+        if value:
+            cap.set(prop, value)
+    return cap
+
+
+# Option values arrive as strings; numbers and flags are converted here
+def parse_value(value):
+    if value.lower() in ('true', 'yes', 'on'):
+        return True
+    if value.lower() in ('false', 'no', 'off'):
+        return False
+    for convert in (int, float):
+        try:
+            return convert(value)
+        except ValueError:
+            pass
+    return value
+
+
+def parse_source(source):
+    """Split a spec into (kind, target, options); kind is None for plain cv2 sources."""
+    if not isinstance(source, str):
+        return None, source, {}
+    kind, sep, rest = source.partition(':')
+    if not sep or kind not in KINDS:
+        if os.path.isdir(source):
+            return 'images', source, {}
+        return None, source, {}
+    target, _, query = rest.partition('?')
+    options = {key: parse_value(value) for key, value in parse_qsl(query)}
+    return kind, target, options
+
+
+def open_source(source):
+    """Open a camera ``source`` as a capture; the brokers' default ``open_capture``."""
+    kind, target, options = parse_source(source)
+    if kind == 'device':
+        return open_device(target or 0, **options)
+    if kind == 'video':
+        return VideoFileSource(target, **options)
+    if kind == 'images':
+        return ImageSequenceSource(target, **options)
+    if kind == 'synthetic':
+        if target:
+            options.setdefault('images', target)
+        return SyntheticSource(**options)
+    return cv2.VideoCapture(target)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Read frames from a source and report the rate achieved')
+    parser.add_argument('source', help='camera source or spec, e.g. "synthetic:?fps=30&faces=3"')
+    parser.add_argument('--frames', type=int, default=100, help='frames to read')
+    parser.add_argument('--write', default=None, help='also save the frames to this video file')
+    args = parser.parse_args()
+
+    source = int(args.source) if args.source.isdigit() else args.source
+    cap = open_source(source)
+    if not cap.isOpened():
+        print(f"Could not open source: {args.source}")
+        return 1
+
+    writer = None
+    start = time.monotonic()
+    read = 0
+    try:
+        for _ in range(args.frames):
+            success, img = cap.read()
+            if not success:
+                break
+            read += 1
+            if args.write:
+                if writer is None:
+                    interval = getattr(getattr(cap, 'pacer', None), 'interval', 0)
+                    writer = cv2.VideoWriter(args.write, cv2.VideoWriter_fourcc(*'mp4v'),
+                                             1.0 / interval if interval else 25.0,
+                                             (img.shape[1], img.shape[0]))
+                writer.write(img)
+    finally:
+        cap.release()
+        if writer is not None:
+            writer.release()
+    elapsed = time.monotonic() - start
+    print(f"Read {read} frames in {elapsed:.1f}s ({read / elapsed if elapsed else 0:.1f} fps)")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
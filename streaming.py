@@ -0,0 +1,179 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from metrics import JPEG_ENCODE_SECONDS
+
+
+BOUNDARY = b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
+
+# Requested widths and qualities are snapped to these steps so that viewers
+# asking for nearly the same tile share one variant
+WIDTH_STEP = 80
+QUALITY_STEP = 10
+MIN_QUALITY = 10
+MAX_QUALITY = 95
+
+
+def stream_variant(width=None, quality=None):
+    """Normalise a requested (width, quality) to the variant actually served.
+
+    ``None`` means full resolution / OpenCV's default quality.
+    """
+    if width is not None and width > 0:
+        width = max(WIDTH_STEP, (width + WIDTH_STEP - 1) // WIDTH_STEP * WIDTH_STEP)
+    else:
+        width = None
+    if quality is not None:
+        quality = int(round(quality / QUALITY_STEP)) * QUALITY_STEP
+        quality = min(max(quality, MIN_QUALITY), MAX_QUALITY)
+    return width, quality
+
+
+# A multipart part showing ``text`` on a dark frame, for streams that have
+# nothing live to show
+def placeholder_part(text, width=640, height=480):
+    img = np.full((height, width, 3), 40, dtype=np.uint8)
+    cv2.putText(img, text, (20, height // 2), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (200, 200, 200), 2)
+    ret, buffer = cv2.imencode('.jpg', img)
+    return BOUNDARY + buffer.tobytes() + b'\r\n'
+
+
+# Histogram child per variant, labelled like "full" or "320w-q50"
+def encode_timer(variant):
+    width, quality = variant
+    label = '-'.join(part for part in (f'{width}w' if width else '', f'q{quality}' if quality else '') if part)
+    return JPEG_ENCODE_SECONDS.labels(label or 'full')
+
+
+class BroadcastFrame:
+    """One published frame; each variant's multipart JPEG part is encoded at most once.
+
+    ``trace`` is the pipeline frame it was drawn from (trace id and capture
+    time); the first encode records its capture-to-display age in ``latency``.
+    """
+
+    __slots__ = ('seq', 'image', 'trace_id', 'captured_at', 'latency', '_parts', '_scaled', '_lock')
+
+    def __init__(self, seq, image, trace=None, latency=None):
+        self.seq = seq
+        self.image = image
+        self.trace_id = getattr(trace, 'trace_id', None)
+        self.captured_at = getattr(trace, 'captured_at', None)
+        self.latency = latency
+        self._parts = {}
+        self._scaled = {}
+        self._lock = threading.Lock()
+
+    def key(self, variant):
+        width, quality = variant
+        if width is not None and width >= self.image.shape[1]:
+            return None, quality  # no upscaling, share the full-size part
+        return variant
+
+    # The part if some viewer already encoded it, without waiting
+    def cached(self, variant=(None, None)):
+        return self._parts.get(self.key(variant))
+
+    def part(self, variant=(None, None)):
+        # The first viewer to ask for a variant encodes it; the others wait
+        # for its result
+        variant = self.key(variant)
+        part = self._parts.get(variant)
+        if part is None:
+            with self._lock:
+                part = self._parts.get(variant)
+                if part is None:
+                    start = time.perf_counter()
+                    width, quality = variant
+                    params = [cv2.IMWRITE_JPEG_QUALITY, quality] if quality is not None else []
+                    ret, buffer = cv2.imencode('.jpg', self.scaled(width), params)
+                    first = not self._parts
+                    part = self._parts[variant] = self.header() + buffer.tobytes() + b'\r\n'
+                    encode_timer(variant).observe(time.perf_counter() - start)
+                    if first and self.latency is not None and self.captured_at is not None:
+                        self.latency.since('encoded', self.captured_at, self.trace_id)
+        return part
+
+    # Part headers; the trace id lets a client match a frame to server traces
+    def header(self):
+        if self.trace_id is None:
+            return BOUNDARY
+        return (b'--frame\r\nContent-Type: image/jpeg\r\nX-Trace-Id: ' + self.trace_id.encode('ascii', 'replace')
+                + b'\r\n\r\n')
+
+    def scaled(self, width):
+        # Resized copies are shared by every quality tier of the same width
+        if width is None:
+            return self.image
+        img = self._scaled.get(width)
+        if img is None:
+            height = max(1, round(self.image.shape[0] * width / self.image.shape[1]))
+            img = self._scaled[width] = cv2.resize(self.image, (width, height), interpolation=cv2.INTER_AREA)
+        return img
+
+
+class FrameBroadcaster:
+    """Fans one camera's annotated frames out to any number of MJPEG viewers.
+
+    ``publish`` only swaps in the new frame and bumps its sequence number.
+    Each frame is JPEG-encoded once, by whichever viewer reaches it first and
+    outside the broadcaster's lock, and the bytes are shared with every other
+    viewer. Viewers block on a condition variable until a newer frame arrives,
+    so nothing is encoded when nobody is watching and a frame is never sent
+    twice to the same viewer. Viewers can ask for a smaller width or a lower
+    JPEG quality; each such variant is likewise produced once per frame and
+    shared by everyone watching it.
+    """
+
+    def __init__(self):
+        self.viewers = 0
+        self.listeners = []
+        self._seq = 0
+        self._frame = None
+        self._cond = threading.Condition()
+
+    def publish(self, img, trace=None, latency=None):
+        with self._cond:
+            self._seq += 1
+            self._frame = BroadcastFrame(self._seq, img, trace, latency)
+            self._cond.notify_all()
+        for listener in self.listeners:
+            listener()
+
+    def latest(self):
+        with self._cond:
+            return self._frame
+
+    def wait_next(self, after_seq, timeout=1.0):
+        """Return the newest frame past ``after_seq``, or None on timeout."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > after_seq, timeout)
+            if self._seq > after_seq:
+                return self._frame
+            return None
+
+    def join(self):
+        with self._cond:
+            self.viewers += 1
+
+    def leave(self):
+        with self._cond:
+            self.viewers -= 1
+
+    def stream(self, width=None, quality=None):
+        """Generator of multipart chunks for one viewer."""
+        variant = stream_variant(width, quality)
+        self.join()
+        try:
+            seq = 0
+            while True:
+                frame = self.wait_next(seq)
+                if frame is None:
+                    continue
+                seq = frame.seq
+                yield frame.part(variant)
+        finally:
+            self.leave()
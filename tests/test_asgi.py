@@ -0,0 +1,86 @@
+import asyncio
+import importlib
+import json
+import os
+
+import pytest
+
+pytest.importorskip('face_recognition')
+
+
+@pytest.fixture(scope='module')
+def servers(tmp_path_factory):
+    # Importing the app creates its attendance files in the working directory
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('app'))
+    try:
+        imagerec = importlib.import_module('imagerec')
+        asgi = importlib.import_module('asgi')
+        imagerec.attendance_store.append([('ALICE', '09:00:00', '2026-03-02'),
+                                          ('BOB', '09:05:00', '2026-03-02'),
+                                          ('ALICE', '09:01:00', '2026-03-03')])
+        imagerec.add_recognition_event('main', 'ALICE', 'ALICE - Marked')
+        yield imagerec, asgi
+    finally:
+        os.chdir(cwd)
+
+
+def asgi_get(app, path, query=''):
+    """Run one GET through the ASGI app; returns (status, headers, body)."""
+    scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': query.encode(),
+             'headers': [], 'root_path': '', 'scheme': 'http', 'http_version': '1.1',
+             'server': ('testserver', 80), 'client': ('127.0.0.1', 1)}
+    requests = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+    messages = []
+
+    # Like a server: the request body once, then nothing until the client leaves
+    async def receive():
+        if requests:
+            return requests.pop()
+        await asyncio.Event().wait()
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    start = messages[0]
+    body = b''.join(m.get('body', b'') for m in messages[1:])
+    return start['status'], dict(start['headers']), body
+
+
+@pytest.mark.parametrize('path, query', [
+    ('/api/events', ''),
+    ('/api/events', 'camera=main'),
+    ('/api/events', 'camera=nope'),
+    ('/api/attendance', 'date=2026-03-02'),
+    ('/api/attendance', 'date=2020-01-01'),
+    ('/api/report', 'start_date=2026-03-01&end_date=2026-03-05'),
+    ('/video_feed/nope', ''),
+])
+def test_native_routes_match_flask(servers, path, query):
+    imagerec, asgi = servers
+    status, headers, body = asgi_get(asgi.app, path, query)
+    flask = imagerec.app.test_client().get(f'{path}?{query}' if query else path)
+    assert status == flask.status_code
+    assert headers[b'content-type'] == flask.headers['Content-Type'].encode()
+    assert body == flask.data
+
+
+def test_stats_match_flask(servers):
+    imagerec, asgi = servers
+    status, _, body = asgi_get(asgi.app, '/api/stats')
+    flask = imagerec.app.test_client().get('/api/stats')
+    assert status == flask.status_code == 200
+    ours, theirs = json.loads(body), flask.get_json()
+    # The only field that may differ between the two requests is the clock
+    ours.pop('time', None)
+    theirs.pop('time', None)
+    assert ours == theirs
+
+
+def test_other_routes_are_bridged_to_flask(servers):
+    imagerec, asgi = servers
+    status, _, body = asgi_get(asgi.app, '/api/no-such-route')
+    flask = imagerec.app.test_client().get('/api/no-such-route')
+    assert status == flask.status_code == 404
+    assert body == flask.data
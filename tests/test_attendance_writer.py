@@ -0,0 +1,120 @@
+import csv
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+import pytest
+
+from attendance import AttendanceLedger, AttendanceWriter, CsvAttendanceStore, attendance_filename
+
+DATE = '2026-03-02'
+MORNING = datetime(2026, 3, 2, 9, 0, 0)
+
+
+def read_rows(directory, date_str=DATE):
+    filename = attendance_filename(date_str, directory)
+    if not os.path.isfile(filename):
+        return []
+    with open(filename, newline='', encoding='utf-8') as f:
+        return [(row['Name'], row['Time'], row['Date']) for row in csv.DictReader(f)]
+
+
+def write_journal(path, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        csv.writer(f, lineterminator='\n').writerows(rows)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+class FlakyStore(CsvAttendanceStore):
+    """A CSV store whose first ``failures`` appends raise, like a locked database."""
+
+    def __init__(self, directory, failures):
+        super().__init__(directory)
+        self.failures = failures
+
+    def append(self, rows):
+        if self.failures:
+            self.failures -= 1
+            raise sqlite3.OperationalError('database is locked')
+        super().append(rows)
+
+
+@pytest.fixture
+def writer_factory(tmp_path):
+    writers = []
+
+    def make(store, **options):
+        options.setdefault('flush_interval', 0.05)
+        writer = AttendanceWriter(store, journal=str(tmp_path / 'attendance.journal'), **options)
+        writers.append(writer)
+        return writer
+
+    yield make
+    for writer in writers:
+        writer.stop()
+
+
+def test_replay_after_crash_adds_only_missing_rows(tmp_path, writer_factory):
+    store = CsvAttendanceStore(str(tmp_path))
+    # The crash happened after ALICE reached the store but before BOB did
+    store.append([('ALICE', '09:00:00', DATE)])
+    write_journal(tmp_path / 'attendance.journal', [('ALICE', '09:00:00', DATE), ('BOB', '09:00:05', DATE)])
+
+    writer = writer_factory(store)
+    writer.start()
+
+    assert read_rows(str(tmp_path)) == [('ALICE', '09:00:00', DATE), ('BOB', '09:00:05', DATE)]
+    assert not os.path.exists(tmp_path / 'attendance.journal')
+
+
+def test_failed_batch_is_retried_and_journal_kept_until_written(tmp_path, writer_factory):
+    store = FlakyStore(str(tmp_path), failures=2)
+    writer = writer_factory(store)
+    writer.start()
+    ledger = AttendanceLedger(store, writer)
+
+    assert ledger.mark('ALICE', MORNING).endswith('Marked')
+    assert wait_for(lambda: store.failures == 1)
+    assert os.path.exists(tmp_path / 'attendance.journal')
+    assert writer._thread.is_alive()
+
+    assert wait_for(lambda: read_rows(str(tmp_path)))
+    writer.stop()
+    assert [row[0] for row in read_rows(str(tmp_path))] == ['ALICE']
+    assert not os.path.exists(tmp_path / 'attendance.journal')
+
+
+def test_rows_from_a_failing_store_are_replayed_after_a_crash(tmp_path, writer_factory):
+    failing = FlakyStore(str(tmp_path), failures=10 ** 6)
+    writer = writer_factory(failing)
+    writer.start()
+    assert writer.submit(('ALICE', '09:00:00', DATE))
+    assert wait_for(lambda: writer._failed)
+    # Stopping while the store still fails leaves the journal behind
+    writer.stop()
+    assert os.path.exists(tmp_path / 'attendance.journal')
+
+    writer = writer_factory(CsvAttendanceStore(str(tmp_path)))
+    writer.start()
+    assert read_rows(str(tmp_path)) == [('ALICE', '09:00:00', DATE)]
+
+
+def test_submit_refuses_rows_while_not_running(tmp_path, writer_factory):
+    store = CsvAttendanceStore(str(tmp_path))
+    writer = writer_factory(store)
+    ledger = AttendanceLedger(store, writer)
+
+    assert not writer.submit(('ALICE', '09:00:00', DATE))
+    assert ledger.mark('ALICE', MORNING).endswith('Pending')
+    # The refused mark is not remembered, so it is retried once running
+    writer.start()
+    assert ledger.mark('ALICE', MORNING).endswith('Marked')
@@ -0,0 +1,65 @@
+from eventstream import EventHub
+
+
+def event_ids(text):
+    return [int(line[4:]) for line in text.splitlines() if line.startswith('id: ')]
+
+
+def test_new_client_starts_after_the_latest_event():
+    hub = EventHub()
+    hub.publish('stats', {'presentToday': 1})
+    last_id, prelude = hub.join()
+    assert last_id == 1
+    assert prelude == 'retry: 3000\n\n'
+    assert hub.next_chunk(last_id, 0) == (1, None)
+
+
+def test_resume_from_last_event_id_sends_the_missed_events():
+    hub = EventHub()
+    for n in range(5):
+        hub.publish('attendance', {'n': n})
+
+    last_id, prelude = hub.join(2)
+    assert 'resync' not in prelude
+    last_id, text = hub.next_chunk(last_id, 0)
+    assert last_id == 5
+    assert event_ids(text) == [3, 4, 5]
+    assert 'event: attendance\ndata: {"n": 2}\n\n' in text
+
+
+def test_client_behind_the_buffer_gets_a_resync():
+    hub = EventHub(history=3)
+    for n in range(10):
+        hub.publish('attendance', {'n': n})
+
+    last_id, text = hub.next_chunk(2, 0)
+    assert last_id == 10
+    assert text == 'id: 10\nevent: resync\ndata: {}\n\n'
+
+
+def test_id_from_before_a_restart_resyncs_on_join():
+    hub = EventHub()
+    hub.publish('stats', {})
+    last_id, prelude = hub.join(500)
+    assert last_id == 1
+    assert prelude.endswith('id: 1\nevent: resync\ndata: {}\n\n')
+
+
+def test_stream_sends_keepalives_and_counts_subscribers():
+    hub = EventHub(keepalive=0.01)
+    stream = hub.stream()
+    assert next(stream) == 'retry: 3000\n\n'
+    assert hub.subscribers == 1
+    assert next(stream).startswith(':')
+    hub.publish('recognition', {'name': 'ALICE'})
+    assert event_ids(next(stream)) == [1]
+    stream.close()
+    assert hub.subscribers == 0
+
+
+def test_listeners_are_called_on_publish():
+    hub = EventHub()
+    calls = []
+    hub.listeners.append(lambda: calls.append(1))
+    hub.publish('stats', {})
+    assert calls == [1]
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('face_recognition')
+
+from gallery import GalleryMatrix, IVFIndex, match_encodings, measure_recall  # noqa: E402
+
+
+def clustered_encodings(n, clusters=32, seed=0):
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(scale=0.3, size=(clusters, 128))
+    return (centres[rng.integers(clusters, size=n)] + rng.normal(scale=0.05, size=(n, 128))).astype(np.float32)
+
+
+def noisy_queries(encodings, count, seed=1):
+    rng = np.random.default_rng(seed)
+    return encodings[rng.choice(len(encodings), count)] + rng.normal(scale=0.02, size=(count, 128))
+
+
+def ivf_gallery(encodings, **options):
+    options.setdefault('min_train_size', 1)
+    return GalleryMatrix([str(i) for i in range(len(encodings))], encodings, index=IVFIndex(**options))
+
+
+def test_probing_every_cell_matches_exact_search():
+    encodings = clustered_encodings(2000)
+    queries = noisy_queries(encodings, 100)
+    gallery = ivf_gallery(encodings, n_lists=16, n_probe=16)
+
+    snapshot = gallery.snapshot
+    expected, expected_distances = match_encodings(snapshot.matrix, snapshot.sq_norms, queries)
+    found, distances = snapshot.search(queries)
+    assert np.array_equal(found, expected)
+    np.testing.assert_allclose(distances, expected_distances, rtol=1e-5)
+
+
+def test_recall_against_exact_search():
+    encodings = clustered_encodings(4000)
+    queries = noisy_queries(encodings, 200)
+    recall, _ = measure_recall(ivf_gallery(encodings, n_lists=64, n_probe=8), queries)
+    assert recall >= 0.95
+
+
+def test_more_cells_than_rows_is_clamped():
+    encodings = clustered_encodings(5)
+    gallery = ivf_gallery(encodings, n_lists=64)
+    found, _ = gallery.snapshot.search(encodings)
+    assert found.tolist() == list(range(5))
+
+
+def test_added_rows_are_found_without_retraining():
+    encodings = clustered_encodings(1000)
+    gallery = ivf_gallery(encodings[:600], n_lists=16, n_probe=16)
+    for i in range(600, 700):
+        gallery.add(str(i), encodings[i])
+
+    found, _ = gallery.snapshot.search(encodings[600:700])
+    assert found.tolist() == list(range(600, 700))
@@ -0,0 +1,48 @@
+import threading
+
+import pytest
+
+pytest.importorskip('face_recognition')
+
+from pipeline import DropOldestQueue  # noqa: E402
+
+
+def test_put_drops_the_oldest_item_when_full():
+    queue = DropOldestQueue(maxsize=2)
+    assert queue.put(1) is None
+    assert queue.put(2) is None
+    assert queue.put(3) == 1
+    assert queue.dropped == 1
+    assert len(queue) == 2
+
+
+def test_get_is_fifo():
+    queue = DropOldestQueue(maxsize=3)
+    for item in (1, 2, 3):
+        queue.put(item)
+    assert [queue.get(), queue.get(), queue.get()] == [1, 2, 3]
+
+
+def test_get_latest_takes_the_newest_and_drops_the_rest():
+    queue = DropOldestQueue(maxsize=3)
+    for item in (1, 2, 3):
+        queue.put(item)
+    assert queue.get_latest() == 3
+    assert queue.dropped == 2
+    assert len(queue) == 0
+
+
+def test_get_times_out_on_an_empty_queue():
+    queue = DropOldestQueue()
+    assert queue.get(timeout=0.01) is None
+    assert queue.get_latest(timeout=0.01) is None
+
+
+def test_get_wakes_up_when_an_item_arrives():
+    queue = DropOldestQueue()
+    timer = threading.Timer(0.05, queue.put, args=('frame',))
+    timer.start()
+    try:
+        assert queue.get_latest(timeout=2.0) == 'frame'
+    finally:
+        timer.cancel()
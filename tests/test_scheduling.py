@@ -0,0 +1,59 @@
+import pytest
+
+from scheduling import DetectionScheduler
+
+
+def test_first_pass_is_allowed():
+    assert DetectionScheduler().should_detect(now=0.0)
+
+
+def test_cost_sets_the_interval_for_the_detect_share():
+    scheduler = DetectionScheduler(detect_share=0.5, max_interval=10.0)
+    scheduler.record(0.1, now=1.0)
+    # Detection may use half the time: 0.1 s of work, then 0.1 s of rest
+    assert scheduler.interval == pytest.approx(0.1)
+    assert not scheduler.should_detect(now=1.05)
+    assert scheduler.should_detect(now=1.1)
+
+
+def test_a_running_pass_is_reserved():
+    scheduler = DetectionScheduler(detect_share=0.5, latency_budget=1.0, max_interval=10.0)
+    scheduler.record(0.3, now=0.0)
+    scheduler.begin(now=1.0)
+    # The pass counts as ending after its expected 0.3 s, and the next one
+    # waits the interval after that rather than starting alongside it
+    assert not scheduler.should_detect(now=1.0)
+    assert not scheduler.should_detect(now=1.5)
+    assert scheduler.should_detect(now=1.6)
+
+
+def test_an_older_pass_finishing_late_keeps_the_newer_reservation():
+    scheduler = DetectionScheduler(detect_share=0.5, latency_budget=1.0, max_interval=10.0)
+    scheduler.record(0.3, now=0.0)
+    scheduler.begin(now=1.0)
+    scheduler.record(0.3, now=1.1)
+    assert scheduler.last_detection == pytest.approx(1.3)
+
+
+def test_slow_passes_back_off_and_recover():
+    scheduler = DetectionScheduler(detect_share=0.5, latency_budget=0.25, max_interval=100.0, smoothing=1.0)
+    scheduler.record(0.5, now=0.0)
+    assert scheduler.backoff == 2.0
+    scheduler.record(0.5, now=1.0)
+    assert scheduler.backoff == 4.0
+    assert scheduler.interval == pytest.approx(0.5 * 4.0)
+    scheduler.record(0.1, now=2.0)
+    scheduler.record(0.1, now=3.0)
+    assert scheduler.backoff == 1.0
+
+
+def test_interval_is_capped():
+    scheduler = DetectionScheduler(max_interval=1.0)
+    scheduler.record(5.0, now=0.0)
+    assert scheduler.interval == 1.0
+
+
+def test_frame_delay_fills_the_frame_interval():
+    scheduler = DetectionScheduler(target_fps=20)
+    assert scheduler.frame_delay(0.0, now=0.02) == pytest.approx(0.03)
+    assert scheduler.frame_delay(0.0, now=0.1) == 0.0
@@ -0,0 +1,50 @@
+import collections
+import time
+
+import numpy as np
+
+
+class LatencyTracker:
+    """Rolling capture-relative latencies for one camera.
+
+    Every frame carries its capture time (``time.monotonic``) and a trace id
+    through the pipeline. At each checkpoint the frame's age is recorded:
+
+    detected   its face boxes reached the tracker
+    matched    its faces were encoded, matched and attendance marked
+    annotated  the annotated copy was handed to the streamers
+    encoded    the first JPEG of it was ready for a viewer (capture-to-display)
+
+    Only the last ``window`` samples per checkpoint are kept, so memory is
+    fixed and the percentiles describe recent behaviour.
+    """
+
+    CHECKPOINTS = ('detected', 'matched', 'annotated', 'encoded')
+
+    def __init__(self, window=1000):
+        self.samples = {checkpoint: collections.deque(maxlen=window) for checkpoint in self.CHECKPOINTS}
+        self.last_trace = {}
+
+    def since(self, checkpoint, captured_at, trace_id=None):
+        age = time.monotonic() - captured_at
+        # deque.append is atomic, so pipeline threads need no lock here
+        self.samples[checkpoint].append(age)
+        if trace_id is not None:
+            self.last_trace[checkpoint] = trace_id
+        return age
+
+    def summary(self):
+        result = {}
+        for checkpoint, samples in self.samples.items():
+            ages = np.array(list(samples))
+            entry = {'count': len(ages), 'last_trace': self.last_trace.get(checkpoint)}
+            if len(ages):
+                p50, p95, p99 = np.percentile(ages, [50, 95, 99]) * 1000
+                entry.update(p50_ms=round(float(p50), 1), p95_ms=round(float(p95), 1),
+                             p99_ms=round(float(p99), 1), max_ms=round(float(ages.max()) * 1000, 1))
+            result[checkpoint] = entry
+        return result
+
+    def percentile_ms(self, checkpoint, q):
+        samples = list(self.samples[checkpoint])
+        return float(np.percentile(samples, q)) * 1000 if samples else None
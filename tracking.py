@@ -0,0 +1,112 @@
+import itertools
+import time
+
+import numpy as np
+
+
+# Intersection over union of boxes given as (top, right, bottom, left)
+def box_iou(boxes_a, boxes_b):
+    a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float64).reshape(-1, 4)
+    top = np.maximum(a[:, None, 0], b[None, :, 0])
+    right = np.minimum(a[:, None, 1], b[None, :, 1])
+    bottom = np.minimum(a[:, None, 2], b[None, :, 2])
+    left = np.maximum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(bottom - top, 0, None) * np.clip(right - left, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 1] - a[:, 3])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 1] - b[:, 3])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+
+class Track:
+    __slots__ = ('id', 'box', 'name', 'label', 'confidence', 'last_seen', 'last_verified', 'missed',
+                 'encoding')
+
+    def __init__(self, track_id, box, now):
+        self.id = track_id
+        self.box = box
+        self.name = None
+        self.label = None
+        self.confidence = 1.0
+        self.last_seen = now
+        self.last_verified = None
+        self.missed = 0
+        # Set while an encoding for the track is queued or running
+        self.encoding = False
+
+    @property
+    def known(self):
+        return self.name is not None
+
+
+class FaceTracker:
+    """Follows faces from one detection pass to the next by box overlap.
+
+    Detections are paired greedily with existing tracks, highest IoU first;
+    the IoU of the pairing is the track's confidence. A track only needs a
+    fresh encoding when it is new, when its identity is older than
+    ``reverify_interval`` seconds, or when its confidence fell below
+    ``min_confidence`` (fast motion, or someone else stepping into the box).
+    Tracks that go unmatched for ``max_missed`` passes are dropped.
+    """
+
+    def __init__(self, iou_threshold=0.3, min_confidence=0.5, reverify_interval=3.0, max_missed=3):
+        self.iou_threshold = iou_threshold
+        self.min_confidence = min_confidence
+        self.reverify_interval = reverify_interval
+        self.max_missed = max_missed
+        self.tracks = []
+        self._ids = itertools.count(1)
+
+    def update(self, boxes, now=None):
+        """Match this pass's face boxes to tracks and return one track per box."""
+        now = time.monotonic() if now is None else now
+        boxes = [tuple(int(v) for v in box) for box in boxes]
+        assigned = [None] * len(boxes)
+        matched = set()
+
+        if self.tracks and boxes:
+            overlaps = box_iou([t.box for t in self.tracks], boxes)
+            while True:
+                t, b = np.unravel_index(np.argmax(overlaps), overlaps.shape)
+                if overlaps[t, b] < self.iou_threshold:
+                    break
+                track = self.tracks[t]
+                track.confidence = float(overlaps[t, b])
+                track.box = boxes[b]
+                track.last_seen = now
+                track.missed = 0
+                assigned[b] = track
+                matched.add(t)
+                overlaps[t, :] = -1
+                overlaps[:, b] = -1
+
+        survivors = []
+        for i, track in enumerate(self.tracks):
+            if i not in matched:
+                track.missed += 1
+                if track.missed > self.max_missed:
+                    continue
+            survivors.append(track)
+
+        for b, box in enumerate(boxes):
+            if assigned[b] is None:
+                assigned[b] = Track(next(self._ids), box, now)
+                survivors.append(assigned[b])
+
+        self.tracks = survivors
+        return assigned
+
+    def needs_encoding(self, track, now=None):
+        now = time.monotonic() if now is None else now
+        return (track.last_verified is None
+                or now - track.last_verified >= self.reverify_interval
+                or track.confidence < self.min_confidence)
+
+    def identify(self, track, name, label, now=None):
+        track.name = name
+        track.label = label
+        track.confidence = 1.0
+        track.encoding = False
+        track.last_verified = time.monotonic() if now is None else now